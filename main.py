@@ -2,22 +2,40 @@ import sys
 import json
 import os
 import re
-import shutil
+import sqlite3
+import threading
+import bisect
+import time
+import uuid
+import gzip
+import hashlib
+import zlib
+import struct
 from datetime import datetime
+STARTUP_STARTED = time.perf_counter() # точка отсчёта для --profile-startup
 from PyQt6.QtWidgets import (QApplication, QWidget, QPushButton, QVBoxLayout,QScrollArea,
-                             QLabel, QLineEdit, QListWidget, QListWidgetItem,
+                             QLabel, QLineEdit, QListWidget, QListWidgetItem, QListView,
                              QHBoxLayout, QCheckBox, QTextEdit, QSplitter,
                              QStyle, QMenu, QDialog, QFileDialog, QDialogButtonBox,
                              QRadioButton, QMessageBox, QSpinBox, QInputDialog, QComboBox,
-                             QFontComboBox, QButtonGroup, QColorDialog, QStackedLayout, QTabWidget)
-from PyQt6.QtCore import Qt, QPoint, QUrl, QPropertyAnimation, QEasingCurve, pyqtSignal, QByteArray, QSize, QTimer, QEvent, QParallelAnimationGroup, QObject
-from PyQt6.QtGui import QAction, QMouseEvent, QPalette, QKeyEvent, QPainter, QPixmap, QColor, QFont, QIcon, QTextCursor, QScreen
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+                             QFontComboBox, QButtonGroup, QColorDialog, QStackedLayout, QTabWidget, QProgressDialog)
+from PyQt6.QtCore import Qt, QPoint, QUrl, QPropertyAnimation, QEasingCurve, pyqtSignal, QByteArray, QSize, QTimer, QEvent, QParallelAnimationGroup, QObject, QThread, QAbstractListModel, QSortFilterProxyModel, QModelIndex
+from PyQt6.QtGui import QAction, QMouseEvent, QPalette, QKeyEvent, QPainter, QPixmap, QColor, QFont, QIcon, QTextCursor, QScreen, QImage, QImageReader
+QMediaPlayer = QAudioOutput = None # QtMultimedia импортируется при первом входе в Zen, см. import_multimedia()
 
 # --- Константы ---
 SETTINGS_FILE = "settings.json"
 DATA_FILE = "data.json"
-BACKUP_FILE = "data.json.bak"
+BACKUP_FILE = "data.json.bak" # резервная копия старых версий, показывается при восстановлении
+BACKUP_DIR = "backups"
+# Сколько поколений хранить: последние N штук плюс самое свежее за каждый из последних часов/дней/недель
+BACKUP_RETENTION = {"recent": 6, "hourly": 24, "daily": 7, "weekly": 8}
+JOURNAL_FILE = "data.json.journal"
+DB_FILE = "data.db"
+LOCALE_MANIFEST_FILE = ".manifest.json"
+HISTORY_DB_FILE = "history.db"
+ZEN_RECOVERY_FILE = "zen_recovery.json"
+JOURNAL_COMPACT_SIZE = 512 * 1024
 DEFAULT_SETTINGS = {
     "language": "ru_RU",
     "theme": "light", "trigger_pos": "right", "accent_color": "#00aa00",
@@ -28,10 +46,963 @@ DEFAULT_SETTINGS = {
     "zen_font_family": "Candara", "zen_font_size": 14,
     "zen_font_color": "", "zen_alignment": "left",
     "zen_first_line_indent": 20,
-    "splitter_ratio": [40, 60]
+    "splitter_ratio": [40, 60],
+    "storage_mode": "sqlite",
+    "keep_popup_alive": True,
+    "notes_autosave_seconds": 0
 }
+# Ключи, от которых зависит оформление главного окна и панели настроек
+THEME_SETTING_KEYS = frozenset(("theme", "accent_color", "light_theme_bg", "light_theme_text", "light_theme_list_text", "dark_theme_bg", "dark_theme_text", "dark_theme_list_text"))
+SETTINGS_APPLY_INTERVAL_MS = 100 # изменения в панели настроек (удержание стрелки спинбокса) применяются не чаще раза за интервал
+SETTINGS_SAVE_DELAY_MS = 1000 # settings.json пишется после паузы в изменениях
 POMODORO_WORK_TIME = 25*60
 POMODORO_BREAK_TIME = 5 * 60
+NOTE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TASK_DUE_FORMAT = "%Y-%m-%d"
+ZEN_AUTOSAVE_IDLE_MS = 3000 # снимок после паузы в наборе...
+ZEN_AUTOSAVE_MAX_MS = 60000 # ...но не реже раза в минуту при непрерывном наборе
+
+# --- Профилирование запуска ---
+class StartupProfiler:
+    # Включается флагом --profile-startup: длительность каждой фазы запуска от предыдущей отметки
+    def __init__(self, enabled, started=STARTUP_STARTED):
+        self.enabled = enabled; self.started = self.last = started; self.phases = []
+
+    def mark(self, phase):
+        if not self.enabled: return
+        now = time.perf_counter(); self.phases.append((phase, now - self.last)); self.last = now
+
+    def report(self):
+        if not self.enabled: return
+        print("Профиль запуска:")
+        for phase, seconds in self.phases: print(f"  {phase:<34}{seconds * 1000:8.1f} мс")
+        print(f"  {'Итого':<34}{(self.last - self.started) * 1000:8.1f} мс")
+
+    def timing(self, label, started):
+        # Разовые замеры после запуска (показ панели и т.п.) - под тем же флагом
+        if self.enabled: print(f"{label} за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+def import_multimedia():
+    # Загрузка QtMultimedia поднимает звуковой бэкенд и заметно замедляет запуск, а нужна только в Zen
+    global QMediaPlayer, QAudioOutput
+    if QMediaPlayer is None: from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+
+# --- Хранилище данных ---
+def write_json_atomic(path, data, indent=4):
+    # Пишем во временный файл и подменяем им целевой, чтобы сбой не оставил полупустой файл
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+def remove_file(path):
+    if os.path.exists(path): os.remove(path)
+
+
+class BackgroundWriter(QThread):
+    # Единственный поток записи на диск. Задачи с одинаковым ключом (обычно путь к файлу)
+    # сливаются: выполняется только последняя поставленная.
+    write_finished = pyqtSignal(str, bool)
+    def __init__(self, parent=None, coalesce_ms=150):
+        super().__init__(parent)
+        self.coalesce_ms = coalesce_ms
+        self._jobs = {}; self._cond = threading.Condition(); self._stopping = False
+
+    def submit(self, key, job):
+        with self._cond:
+            self._jobs[key] = job
+            self._cond.notify()
+
+    def write_json(self, path, data):
+        self.submit(path, lambda: write_json_atomic(path, data))
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._stopping: self._cond.wait()
+                if not self._jobs: return
+                stopping = self._stopping
+            if not stopping: self.msleep(self.coalesce_ms) # даём накопиться всплеску запросов
+            with self._cond: jobs = self._jobs; self._jobs = {}
+            for key, job in jobs.items():
+                try: job(); ok = True
+                except Exception as e: print(f"Ошибка записи {key}: {e}"); ok = False
+                self.write_finished.emit(key, ok)
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.wait()
+
+
+def find_tags(text): return set(re.findall(r'#(\w+)', text))
+
+def note_now(): return datetime.now().strftime(NOTE_TIME_FORMAT)
+
+def changed_settings(old, new): return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+def theme_settings(settings): return {key: settings.get(key) for key in THEME_SETTING_KEYS}
+
+def new_note(text):
+    now = note_now()
+    return {"id": uuid.uuid4().hex, "created": now, "modified": now, "text": text}
+
+def migrate_note(note):
+    # Старый формат: заметка определялась строкой timestamp с точностью до секунды
+    if "id" in note: return note
+    migrated = {k: v for k, v in note.items() if k != "timestamp"}; timestamp = note.get("timestamp", "")
+    migrated.update(id=uuid.uuid4().hex, created=timestamp, modified=timestamp, text=note.get("text", ""))
+    return migrated
+
+
+def note_search_text(note): return f"{note['created']} {note.get('text', '')}"
+
+class NoteSearchIndex:
+    # Инвертированный индекс: слово -> ключи заметок, плюс триграммы по словарю слов
+    # для поиска подстрок. Подстрока запроса сначала сужается до заметок, содержащих
+    # самое длинное слово запроса, и только эти кандидаты проверяются целиком.
+    def __init__(self):
+        self.docs = {}; self.postings = {}; self.token_trigrams = {}
+
+    def _tokens(self, doc): return set(re.findall(r'\w+', doc))
+
+    def _trigrams(self, token): return {token[i:i + 3] for i in range(len(token) - 2)}
+
+    def update(self, key, text):
+        self.remove(key)
+        doc = text.lower(); self.docs[key] = doc
+        for token in self._tokens(doc):
+            keys = self.postings.get(token)
+            if keys is None:
+                keys = self.postings[token] = set()
+                for trigram in self._trigrams(token): self.token_trigrams.setdefault(trigram, set()).add(token)
+            keys.add(key)
+
+    def remove(self, key):
+        doc = self.docs.pop(key, None)
+        if doc is None: return
+        for token in self._tokens(doc):
+            keys = self.postings.get(token)
+            if keys is None: continue
+            keys.discard(key)
+            if not keys:
+                del self.postings[token]
+                for trigram in self._trigrams(token):
+                    tokens = self.token_trigrams.get(trigram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens: del self.token_trigrams[trigram]
+
+    def tokens_containing(self, part):
+        if len(part) < 3: return [t for t in self.postings if part in t] # короткие куски - проход по словарю, а не по заметкам
+        candidates = None
+        for trigram in sorted(self._trigrams(part), key=lambda tg: len(self.token_trigrams.get(tg, ()))):
+            tokens = self.token_trigrams.get(trigram)
+            if not tokens: return []
+            candidates = set(tokens) if candidates is None else candidates & tokens
+            if not candidates: return []
+        return [t for t in candidates if part in t]
+
+    def search(self, query):
+        # None = подходят все заметки
+        query = query.lower()
+        if not query: return None
+        parts = re.findall(r'\w+', query)
+        if not parts: return {key for key, doc in self.docs.items() if query in doc}
+        longest = max(parts, key=len); candidates = set()
+        for token in self.tokens_containing(longest): candidates |= self.postings[token]
+        if query == longest: return candidates
+        return {key for key in candidates if query in self.docs[key]}
+
+
+class TagIndex:
+    # Тег -> множество ключей заметок. Теги заметки сравниваются со старыми при каждом сохранении,
+    # поэтому тег исчезает, как только его больше нет ни в одной заметке.
+    def __init__(self):
+        self.note_tags = {}; self.tag_notes = {}
+
+    def set_note_tags(self, key, tags):
+        # Возвращает (появившиеся, исчезнувшие) теги в целом по всем заметкам
+        old_tags = self.note_tags.get(key, frozenset()); tags = frozenset(tags)
+        if tags: self.note_tags[key] = tags
+        else: self.note_tags.pop(key, None)
+        added, removed = [], []
+        for tag in tags - old_tags:
+            keys = self.tag_notes.setdefault(tag, set())
+            if not keys: added.append(tag)
+            keys.add(key)
+        for tag in old_tags - tags:
+            keys = self.tag_notes.get(tag, set()); keys.discard(key)
+            if not keys: self.tag_notes.pop(tag, None); removed.append(tag)
+        return added, removed
+
+    def remove_note(self, key): return self.set_note_tags(key, ())[1]
+
+    def keys_with(self, tag): return self.tag_notes.get(tag, set())
+
+    def tags(self): return self.tag_notes.keys()
+
+    def clear(self): self.note_tags.clear(); self.tag_notes.clear()
+
+
+class TaskRecord:
+    # Компактная запись задачи: десятки тысяч задач не должны стоить десятков тысяч словарей и виджетов.
+    # due - срок "ГГГГ-ММ-ДД", priority 0..3 (нет/низкий/средний/высокий), created/completed_at - NOTE_TIME_FORMAT
+    __slots__ = ("text", "completed", "due", "priority", "created", "completed_at")
+    OPTIONAL_FIELDS = ("due", "priority", "created", "completed_at")
+    def __init__(self, text, completed=False, due="", priority=0, created="", completed_at=""):
+        self.text = text; self.completed = completed; self.due = due; self.priority = priority
+        self.created = created; self.completed_at = completed_at
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("text", ""), bool(data.get("completed", False)), data.get("due") or "", int(data.get("priority") or 0), data.get("created") or "", data.get("completed_at") or "")
+
+    def to_dict(self):
+        # Пустые поля не пишутся, чтобы старые записи {"text", "completed"} оставались как есть
+        data = {"text": self.text, "completed": self.completed}
+        for field in self.OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value: data[field] = value
+        return data
+
+    def set_completed(self, completed):
+        self.completed = completed; self.completed_at = note_now() if completed else ""
+
+
+class TaskIndex:
+    # Индексы задач по всем спискам: owner (задача -> имя списка), open (открытые задачи в порядке
+    # добавления) и by_due (открытые задачи со сроком, отсортированные по (срок, -приоритет, номер)).
+    # Сводные виды "сегодня"/"просроченные"/"все открытые" берутся срезами, без обхода списков.
+    # После изменения completed/due/priority задачи нужно вызвать update().
+    def __init__(self):
+        self.owner = {}; self.open = {}; self.by_due = []
+        self.due_keys = {}; self.numbers = {}; self.counter = 0
+
+    def add(self, task, list_name):
+        self.counter += 1; self.numbers[task] = self.counter; self.owner[task] = list_name
+        self._index_state(task)
+
+    def add_list(self, list_name, tasks):
+        for task in tasks: self.add(task, list_name)
+
+    def remove(self, task):
+        self._unindex_state(task); self.owner.pop(task, None); self.numbers.pop(task, None)
+
+    def remove_list(self, tasks):
+        for task in tasks: self.remove(task)
+
+    def rename_list(self, tasks, new_name):
+        for task in tasks: self.owner[task] = new_name
+
+    def update(self, task):
+        self._unindex_state(task); self._index_state(task)
+
+    def _index_state(self, task):
+        if task.completed: return
+        self.open[task] = None
+        if task.due:
+            key = self.due_keys[task] = (task.due, -task.priority, self.numbers[task])
+            bisect.insort(self.by_due, key + (task,))
+
+    def _unindex_state(self, task):
+        self.open.pop(task, None)
+        key = self.due_keys.pop(task, None)
+        if key is not None: del self.by_due[bisect.bisect_left(self.by_due, key)] # (срок, -приоритет, номер) уникален
+
+    def due_between(self, start, end):
+        # Открытые задачи со сроком start <= due < end; "" - без нижней границы
+        lo = bisect.bisect_left(self.by_due, (start,)); hi = bisect.bisect_left(self.by_due, (end,))
+        return [entry[3] for entry in self.by_due[lo:hi]]
+
+    def due_on(self, day): return self.due_between(day, day + "\0")
+
+    def overdue(self, today): return self.due_between("", today)
+
+    def all_open(self): return list(self.open)
+
+
+class StorageBackend:
+    # Общая часть хранилищ: состояние в памяти, применение записей об изменениях
+    # (task_add, note_upsert, ...) и отложенная запись через BackgroundWriter.
+    # Наследники реализуют _read() и запись накопленных изменений в _write_pending().
+    def __init__(self, writer, key):
+        self.writer = writer; self.key = key
+        self.task_lists = {}; self.notes = {}; self.meta = {"active_task_list": "", "splitter_state": ""} # notes: id -> заметка
+        self._legacy_ids = {}; self.migrated = False
+        self.seq = 0; self.flushed_seq = 0; self.loaded = False
+        self._lock = threading.RLock()
+        self.search_index = None # строится в фоне после загрузки (build_search_index) или при первом поиске
+        self._index_generation = 0; self._index_changes = None # поколение данных и заметки, изменённые во время фоновой постройки
+        self.disk_signature = None
+
+    def load(self, force=False):
+        with self._lock:
+            if self.loaded and not force: return self.snapshot(copy_items=True)
+            data, seq, needs_full_write = self._read()
+            self._reset(data)
+            self.seq = self.flushed_seq = seq; self.loaded = True
+            self.disk_signature = self._disk_signature()
+            if needs_full_write: self.seq += 1; self._queue_full()
+            snapshot = self.snapshot(copy_items=True)
+        if needs_full_write: self.writer.submit(self.key, self._flush)
+        return snapshot
+
+    def _reset(self, data):
+        self.task_lists = {name: list(tasks) for name, tasks in data.get("task_lists", {}).items()}
+        self.notes = {}; self._legacy_ids = {}; self.migrated = False
+        for note in data.get("notes", []): note = self._migrate_note(note); self.notes[note["id"]] = note
+        self.meta = {"active_task_list": data.get("active_task_list", ""), "splitter_state": data.get("splitter_state", "")}
+        self.search_index = None; self._index_generation += 1
+
+    def _apply(self, record):
+        op = record.get("op"); lists = self.task_lists
+        if op == "task_add": lists.setdefault(record["list"], []).append(record["task"])
+        elif op == "task_update":
+            tasks = lists.setdefault(record["list"], [])
+            if 0 <= record["index"] < len(tasks): tasks[record["index"]] = record["task"]
+        elif op == "task_delete":
+            tasks = lists.get(record["list"], [])
+            if 0 <= record["index"] < len(tasks): del tasks[record["index"]]
+        elif op == "list_add": lists.setdefault(record["list"], [])
+        elif op == "list_rename": lists[record["new_name"]] = lists.pop(record["list"], [])
+        elif op == "list_delete": lists.pop(record["list"], None)
+        elif op == "note_upsert":
+            note = record["note"]
+            if "id" not in note: # запись из старого журнала
+                existing = self.notes.get(self._legacy_ids.get(note.get("timestamp", "")))
+                note = dict(existing, text=note.get("text", "")) if existing else self._migrate_note(note)
+            self.notes[note["id"]] = note; self._index_note(note["id"])
+        elif op == "note_delete":
+            key = record["id"] if "id" in record else self._legacy_ids.get(record.get("timestamp"))
+            self.notes.pop(key, None); self._index_note(key)
+        elif op == "meta": self.meta.update(record["meta"])
+
+    def _migrate_note(self, note):
+        if "id" in note: return note
+        migrated = migrate_note(note); self._legacy_ids[note.get("timestamp", "")] = migrated["id"]; self.migrated = True
+        return migrated
+
+    def _index_note(self, key):
+        # Изменение заметки сразу попадает в готовый индекс, а во время фоновой постройки - ещё и в список на догонку
+        if self._index_changes is not None: self._index_changes.add(key)
+        if self.search_index is None: return
+        note = self.notes.get(key)
+        if note is None: self.search_index.remove(key)
+        else: self.search_index.update(key, note_search_text(note))
+
+    def build_search_index(self):
+        # Для фонового потока: индекс строится по снимку заметок без блокировки, а заметки,
+        # изменённые за это время, догоняются под блокировкой перед подменой
+        with self._lock:
+            if self.search_index is not None or self._index_changes is not None: return
+            notes = list(self.notes.values()); generation = self._index_generation; self._index_changes = set()
+        index = NoteSearchIndex()
+        for note in notes: index.update(note["id"], note_search_text(note))
+        with self._lock:
+            changes, self._index_changes = self._index_changes, None
+            stale = generation != self._index_generation
+            if not stale and self.search_index is None:
+                for key in changes:
+                    note = self.notes.get(key)
+                    if note is None: index.remove(key)
+                    else: index.update(key, note_search_text(note))
+                self.search_index = index
+        if stale: self.build_search_index() # данные перечитаны во время постройки - строим заново
+
+    def get_search_index(self):
+        # Если фоновая постройка ещё не закончилась, индекс строится здесь, а фоновый результат отбрасывается
+        with self._lock:
+            if self.search_index is None:
+                self.search_index = NoteSearchIndex()
+                for key, note in self.notes.items(): self.search_index.update(key, note_search_text(note))
+            return self.search_index
+
+    def snapshot(self, copy_items=False):
+        # Записи никогда не изменяются на месте, поэтому для потока записи хватает поверхностной копии
+        with self._lock:
+            wrap = dict if copy_items else (lambda item: item)
+            return {
+                "task_lists": {name: [wrap(t) for t in tasks] for name, tasks in self.task_lists.items()},
+                "active_task_list": self.meta.get("active_task_list", ""),
+                "notes": [wrap(n) for n in self.notes.values()],
+                "splitter_state": self.meta.get("splitter_state", "")
+            }
+
+    def has_pending_writes(self): return self.flushed_seq < self.seq
+
+    def get_note(self, key): return self.notes.get(key) # общий объект: изменять только через commit
+
+    def iter_notes(self):
+        # Заметки по дате создания. Под блокировкой берётся только список ссылок, сами заметки неизменяемы,
+        # поэтому генератор можно потреблять из другого потока
+        with self._lock:
+            if not self.loaded: self.load()
+            notes = sorted(self.notes.values(), key=lambda note: (note.get("created", ""), note["id"]))
+        yield from notes
+
+    def save_note_text(self, key, text):
+        # Точечное сохранение одной заметки: запись ставится в очередь, только если текст изменился.
+        # Возвращает (id заметки, изменилась ли она); для отсутствующего key создаётся новая заметка.
+        with self._lock:
+            if not self.loaded: self.load()
+            note = self.notes.get(key) if key else None
+            if note is not None and note.get("text", "") == text: return key, False
+            note = dict(note, text=text, modified=note_now()) if note is not None else new_note(text)
+            self.commit({"op": "note_upsert", "note": note})
+        return note["id"], True
+
+    def commit(self, record): self.commit_many([record])
+
+    def commit_many(self, records):
+        # Пачка записей попадает на диск одной задачей потока записи (в SQLite - одной транзакцией)
+        with self._lock:
+            if not self.loaded: self.load()
+            for record in records:
+                self.seq += 1; record["seq"] = self.seq
+                self._apply(record)
+                self._queue_record(record)
+        self.writer.submit(self.key, self._flush)
+
+    def replace(self, data):
+        with self._lock:
+            self._reset(data); self.loaded = True; self.seq += 1
+            self._queue_full()
+        self.writer.submit(self.key, self._flush)
+
+    def _flush(self):
+        # Выполняется в потоке BackgroundWriter
+        with self._lock: pending = self._take_pending(); seq = self.seq
+        try: self._write_pending(*pending)
+        except Exception:
+            with self._lock: self._queue_full() # при следующей записи сохраним состояние целиком
+            raise
+        with self._lock: self.disk_signature = self._disk_signature() # наши собственные записи не считаются внешними изменениями
+        self.flushed_seq = seq
+
+    def _disk_signature(self):
+        signature = []
+        for path in self.watched_files():
+            try: stat = os.stat(path); signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError: signature.append(None)
+        return tuple(signature)
+
+    def changed_on_disk(self):
+        # Дешёвая проверка по mtime/размеру вместо повторного разбора файла
+        with self._lock:
+            if not self.loaded or self.has_pending_writes(): return False
+            return self._disk_signature() != self.disk_signature
+
+    def write_backup(self, backup_store):
+        # Снимок берётся сейчас, а сериализация, хэш и сжатие выполняются в потоке записи
+        with self._lock:
+            if not self.loaded: self.load()
+            snapshot = self.snapshot()
+        self.writer.submit(backup_store.directory, lambda: backup_store.create(snapshot))
+
+
+class JournalStorage(StorageBackend):
+    # Состояние = снимок DATA_FILE + журнал мелких изменений (одна JSON-запись на строку).
+    # При journaled=False (режим "json") каждое изменение ставит в очередь полную перезапись снимка.
+    def __init__(self, writer, data_file=DATA_FILE, journal_file=JOURNAL_FILE, compact_size=JOURNAL_COMPACT_SIZE, journaled=True):
+        super().__init__(writer, data_file)
+        self.data_file = data_file; self.journal_file = journal_file; self.compact_size = compact_size; self.journaled = journaled
+        self._pending_lines = []; self._pending_snapshot = None; self._journal_size = 0
+
+    def watched_files(self): return (self.data_file, self.journal_file)
+
+    def _read(self):
+        try:
+            with open(self.data_file, 'r', encoding='utf-8') as f: data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            print("Файл данных не найден."); data = {}
+        self._reset(data)
+        snapshot_seq = seq = data.get("journal_seq", 0)
+        for record in self._read_records(self.journal_file):
+            if record.get("seq", 0) <= snapshot_seq: continue
+            self._apply(record); seq = max(seq, record["seq"])
+        self._journal_size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+        return self.snapshot(), seq, self.migrated # после миграции заметкам нужны сохранённые id
+
+    def _read_records(self, path):
+        if not os.path.exists(path): return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: yield json.loads(line)
+                except json.JSONDecodeError: return # оборванная последняя запись
+
+    def _queue_record(self, record):
+        if not self.journaled: self._queue_full(); return
+        line = json.dumps(record, ensure_ascii=False)
+        self._pending_lines.append(line); self._journal_size += len(line) + 1
+        if self._journal_size > self.compact_size: self._queue_full()
+
+    def _queue_full(self):
+        # Снимок поглощает все ещё не записанные строки журнала
+        snapshot = self.snapshot(); snapshot["journal_seq"] = self.seq
+        self._pending_snapshot = snapshot; self._pending_lines = []; self._journal_size = 0
+
+    def _take_pending(self):
+        pending = (self._pending_snapshot, self._pending_lines)
+        self._pending_snapshot = None; self._pending_lines = []
+        return pending
+
+    def _write_pending(self, snapshot, lines):
+        if snapshot is not None:
+            write_json_atomic(self.data_file, snapshot)
+            if lines:
+                with open(self.journal_file, 'w', encoding='utf-8') as f: f.write("\n".join(lines) + "\n")
+            elif os.path.exists(self.journal_file): os.remove(self.journal_file)
+        elif lines:
+            with open(self.journal_file, 'a', encoding='utf-8') as f: f.write("\n".join(lines) + "\n")
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY, uid TEXT NOT NULL UNIQUE, created TEXT NOT NULL, modified TEXT NOT NULL, text TEXT NOT NULL);
+    CREATE INDEX IF NOT EXISTS idx_notes_created ON notes(created, id);
+    CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS note_tags (
+        note_id INTEGER NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+        tag_id INTEGER NOT NULL REFERENCES tags(id) ON DELETE CASCADE,
+        PRIMARY KEY (note_id, tag_id));
+    CREATE INDEX IF NOT EXISTS idx_note_tags_tag ON note_tags(tag_id);
+    CREATE TABLE IF NOT EXISTS task_lists (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        list_id INTEGER NOT NULL REFERENCES task_lists(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL, text TEXT NOT NULL, completed INTEGER NOT NULL DEFAULT 0,
+        due TEXT NOT NULL DEFAULT '', priority INTEGER NOT NULL DEFAULT 0, created TEXT NOT NULL DEFAULT '', completed_at TEXT NOT NULL DEFAULT '');
+    CREATE INDEX IF NOT EXISTS idx_tasks_list ON tasks(list_id, position);
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+SQLITE_SCHEMA_VERSION = 3
+# Версия 1: заметки получают постоянный uid и отдельные created/modified вместо уникального timestamp
+# Версия 2: у задач появляются срок, приоритет и время создания/выполнения
+# Версия 3: индекс по (created, id) - загрузка заметок в порядке создания идёт по индексу, без сортировки
+SQLITE_MIGRATIONS = {
+    1: """
+        CREATE TABLE notes_v1 (id INTEGER PRIMARY KEY, uid TEXT NOT NULL UNIQUE, created TEXT NOT NULL, modified TEXT NOT NULL, text TEXT NOT NULL);
+        INSERT INTO notes_v1(id, uid, created, modified, text) SELECT id, lower(hex(randomblob(16))), timestamp, timestamp, text FROM notes;
+        DROP TABLE notes;
+        ALTER TABLE notes_v1 RENAME TO notes;
+        CREATE INDEX IF NOT EXISTS idx_notes_created ON notes(created, id);
+    """,
+    2: """
+        ALTER TABLE tasks ADD COLUMN due TEXT NOT NULL DEFAULT '';
+        ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE tasks ADD COLUMN created TEXT NOT NULL DEFAULT '';
+        ALTER TABLE tasks ADD COLUMN completed_at TEXT NOT NULL DEFAULT '';
+    """,
+    3: """
+        CREATE INDEX IF NOT EXISTS idx_notes_created ON notes(created, id);
+    """,
+}
+
+class SqliteStorage(StorageBackend):
+    # Построчное хранение в SQLite (WAL): каждое изменение трогает только свои строки.
+    # Чтение идёт через отдельное соединение в потоке GUI, запись - через соединение потока записи.
+    def __init__(self, writer, db_file=DB_FILE, legacy_data_file=DATA_FILE):
+        super().__init__(writer, db_file)
+        self.db_file = db_file; self.legacy_data_file = legacy_data_file
+        self._pending_records = []; self._pending_full = None; self._write_conn = None
+
+    def watched_files(self): return (self.db_file, self.db_file + "-wal")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL"); conn.execute("PRAGMA foreign_keys=ON")
+        self._upgrade(conn); conn.executescript(SQLITE_SCHEMA) # индексы схемы ссылаются на столбцы, которые появляются только после миграций
+        return conn
+
+    def _upgrade(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SQLITE_SCHEMA_VERSION: return
+        # Новые таблицы сразу создаются по актуальной схеме, поэтому миграция нужна, только если старая форма ещё на месте
+        columns = lambda table: {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        needed = {1: "timestamp" in columns("notes"), 2: bool(columns("tasks")) and "due" not in columns("tasks"), 3: bool(columns("notes"))}
+        conn.execute("PRAGMA foreign_keys=OFF") # иначе пересоздание notes каскадно сотрёт note_tags
+        try:
+            script = "".join(SQLITE_MIGRATIONS[v] for v in range(version + 1, SQLITE_SCHEMA_VERSION + 1) if needed[v])
+            conn.executescript(f"BEGIN; {script} PRAGMA user_version = {SQLITE_SCHEMA_VERSION}; COMMIT;")
+        finally: conn.execute("PRAGMA foreign_keys=ON")
+
+    def _read(self):
+        conn = self._connect()
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            legacy_journal_file = self.legacy_data_file + ".journal"
+            if "migrated_from_json" not in meta and (os.path.exists(self.legacy_data_file) or os.path.exists(legacy_journal_file)):
+                # Первый запуск: переносим data.json (вместе с журналом) в базу одной транзакцией
+                print(f"Перенос данных из {self.legacy_data_file} в {self.db_file}...")
+                return JournalStorage(self.writer, self.legacy_data_file, legacy_journal_file).load(), 0, True
+            task_lists = {}
+            for name, text, completed, due, priority, created, completed_at in conn.execute("SELECT l.name, t.text, t.completed, t.due, t.priority, t.created, t.completed_at FROM task_lists l LEFT JOIN tasks t ON t.list_id = l.id ORDER BY l.id, t.position"):
+                tasks = task_lists.setdefault(name, [])
+                if text is not None: tasks.append(TaskRecord(text, bool(completed), due, priority, created, completed_at).to_dict())
+            notes = [{"id": uid, "created": created, "modified": modified, "text": text} for uid, created, modified, text in conn.execute("SELECT uid, created, modified, text FROM notes ORDER BY created, id")]
+            data = {"task_lists": task_lists, "notes": notes, "active_task_list": meta.get("active_task_list", ""), "splitter_state": meta.get("splitter_state", "")}
+            return data, 0, False
+        finally: conn.close()
+
+    def _queue_record(self, record): self._pending_records.append(record)
+
+    def _queue_full(self): self._pending_full = self.snapshot(); self._pending_records = []
+
+    def _take_pending(self):
+        pending = (self._pending_full, self._pending_records)
+        self._pending_full = None; self._pending_records = []
+        return pending
+
+    def _write_pending(self, full, records):
+        if self._write_conn is None: self._write_conn = self._connect()
+        conn = self._write_conn
+        with conn:
+            if full is not None: self._write_full(conn, full)
+            for record in records: self._write_record(conn, record)
+
+    def _list_id(self, conn, name):
+        conn.execute("INSERT OR IGNORE INTO task_lists(name) VALUES (?)", (name,))
+        return conn.execute("SELECT id FROM task_lists WHERE name = ?", (name,)).fetchone()[0]
+
+    def _write_note(self, conn, note):
+        conn.execute("INSERT INTO notes(uid, created, modified, text) VALUES (?, ?, ?, ?) ON CONFLICT(uid) DO UPDATE SET created = excluded.created, modified = excluded.modified, text = excluded.text",
+                     (note["id"], note["created"], note.get("modified", note["created"]), note.get("text", "")))
+        note_id = conn.execute("SELECT id FROM notes WHERE uid = ?", (note["id"],)).fetchone()[0]
+        conn.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
+        for tag in find_tags(note.get("text", "")):
+            conn.execute("INSERT OR IGNORE INTO tags(name) VALUES (?)", (tag,))
+            conn.execute("INSERT OR IGNORE INTO note_tags(note_id, tag_id) SELECT ?, id FROM tags WHERE name = ?", (note_id, tag))
+
+    @staticmethod
+    def _task_values(task): return (task.get("text", ""), int(task.get("completed", False)), task.get("due") or "", int(task.get("priority") or 0), task.get("created") or "", task.get("completed_at") or "")
+
+    def _write_meta(self, conn, meta):
+        conn.executemany("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", meta.items())
+
+    def _write_record(self, conn, record):
+        op = record["op"]
+        if op == "task_add":
+            list_id = self._list_id(conn, record["list"]); task = record["task"]
+            conn.execute("INSERT INTO tasks(list_id, position, text, completed, due, priority, created, completed_at) VALUES (?, (SELECT COUNT(*) FROM tasks WHERE list_id = ?), ?, ?, ?, ?, ?, ?)", (list_id, list_id) + self._task_values(task))
+        elif op == "task_update":
+            task = record["task"]
+            conn.execute("UPDATE tasks SET text = ?, completed = ?, due = ?, priority = ?, created = ?, completed_at = ? WHERE list_id = ? AND position = ?", self._task_values(task) + (self._list_id(conn, record["list"]), record["index"]))
+        elif op == "task_delete":
+            list_id = self._list_id(conn, record["list"])
+            conn.execute("DELETE FROM tasks WHERE list_id = ? AND position = ?", (list_id, record["index"]))
+            conn.execute("UPDATE tasks SET position = position - 1 WHERE list_id = ? AND position > ?", (list_id, record["index"]))
+        elif op == "list_add": self._list_id(conn, record["list"])
+        elif op == "list_rename": conn.execute("UPDATE task_lists SET name = ? WHERE name = ?", (record["new_name"], record["list"]))
+        elif op == "list_delete": conn.execute("DELETE FROM task_lists WHERE name = ?", (record["list"],))
+        elif op == "note_upsert": self._write_note(conn, record["note"])
+        elif op == "note_delete": conn.execute("DELETE FROM notes WHERE uid = ?", (record["id"],))
+        elif op == "meta": self._write_meta(conn, record["meta"])
+
+    def _write_full(self, conn, data):
+        for table in ("note_tags", "tags", "notes", "tasks", "task_lists"): conn.execute(f"DELETE FROM {table}")
+        for name, tasks in data["task_lists"].items():
+            list_id = self._list_id(conn, name)
+            conn.executemany("INSERT INTO tasks(list_id, position, text, completed, due, priority, created, completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(list_id, i) + self._task_values(t) for i, t in enumerate(tasks)])
+        for note in data["notes"]: self._write_note(conn, note)
+        self._write_meta(conn, {"active_task_list": data["active_task_list"], "splitter_state": data["splitter_state"], "migrated_from_json": "1"})
+
+
+class BackupStore:
+    # Поколения резервных копий: <directory>/data-<дата>-<хэш>.json.gz. Копия с тем же содержимым,
+    # что и последняя, не пишется; старые поколения прореживаются по правилам retention.
+    NAME_RE = re.compile(r"^data-(\d{8}-\d{6})-([0-9a-f]{12})\.json\.gz$")
+    BUCKETS = {"hourly": lambda dt: dt.strftime("%Y%m%d%H"), "daily": lambda dt: dt.date(), "weekly": lambda dt: dt.isocalendar()[:2]}
+    def __init__(self, directory=BACKUP_DIR, retention=BACKUP_RETENTION):
+        self.directory = directory; self.retention = retention
+
+    def generations(self):
+        # [(время, хэш, путь)], новые первыми
+        try: names = os.listdir(self.directory)
+        except FileNotFoundError: return []
+        result = []
+        for name in names:
+            match = self.NAME_RE.match(name)
+            if match: result.append((datetime.strptime(match.group(1), "%Y%m%d-%H%M%S"), match.group(2), os.path.join(self.directory, name)))
+        return sorted(result, reverse=True)
+
+    def create(self, data):
+        # Выполняется в потоке BackgroundWriter
+        payload = json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8'); digest = hashlib.sha256(payload).hexdigest()[:12]
+        generations = self.generations()
+        if generations and generations[0][1] == digest: print("Данные не изменились с последней резервной копии, копия не создаётся."); return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"data-{datetime.now():%Y%m%d-%H%M%S}-{digest}.json.gz"); tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f: f.write(gzip.compress(payload))
+        os.replace(tmp_path, path)
+        self.prune(); print(f"Резервная копия создана: {path}")
+        return path
+
+    def prune(self):
+        generations = self.generations()
+        keep = {path for _, _, path in generations[:self.retention.get("recent", 0)]}
+        for rule, bucket in self.BUCKETS.items():
+            seen = set(); limit = self.retention.get(rule, 0)
+            for dt, _, path in generations: # новые первыми: в каждом периоде остаётся самая свежая копия
+                key = bucket(dt)
+                if key in seen: continue
+                if len(seen) >= limit: break
+                seen.add(key); keep.add(path)
+        for _, _, path in generations:
+            if path not in keep:
+                try: os.remove(path)
+                except OSError as e: print(f"Не удалось удалить старую резервную копию {path}: {e}")
+
+    def read(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt', encoding='utf-8') as f: return json.load(f)
+
+
+CHUNK_GEAR = [zlib.crc32(bytes((i,))) for i in range(256)]
+
+def chunk_text(text, boundary_mask=511, min_size=64, max_size=4096):
+    # Границы блоков ставит скользящий gear-хэш по символам (в среднем раз в ~512 символов), а не смещение
+    # или перевод строки, поэтому правка в середине текста - даже в одной длинной строке - меняет только соседние блоки
+    chunks, start, h = [], 0, 0
+    for i, ch in enumerate(text):
+        h = ((h << 1) + CHUNK_GEAR[ord(ch) & 255]) & 0xFFFFFFFF; size = i + 1 - start
+        if size >= max_size or (size >= min_size and h & boundary_mask == 0):
+            chunks.append(text[start:i + 1]); start = i + 1
+    if start < len(text): chunks.append(text[start:])
+    return chunks
+
+HISTORY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, digest BLOB NOT NULL UNIQUE, data BLOB NOT NULL);
+    CREATE TABLE IF NOT EXISTS revisions (
+        id INTEGER PRIMARY KEY, note_id TEXT NOT NULL, saved_at TEXT NOT NULL,
+        content_hash BLOB NOT NULL, size INTEGER NOT NULL, chunks BLOB NOT NULL);
+    CREATE INDEX IF NOT EXISTS idx_revisions_note ON revisions(note_id, id);
+"""
+HISTORY_SCHEMA_VERSION = 1
+# Версия 1: sha256 хранятся сырыми 32 байтами, а версия ссылается на блоки их id (4 байта на блок), а не списком hex-хэшей
+
+def pack_chunk_ids(ids): return struct.pack(f"<{len(ids)}I", *ids)
+
+def unpack_chunk_ids(blob): return struct.unpack(f"<{len(blob) // 4}I", blob)
+
+class NoteHistory:
+    # История версий заметок с дедупликацией: текст режется на блоки (chunk_text), каждый блок
+    # хранится один раз по своему sha256, а версия - это только упакованный список id блоков.
+    # Запись идёт через соединение потока записи, чтение - через соединение потока GUI.
+    def __init__(self, writer, db_file=HISTORY_DB_FILE):
+        self.writer = writer; self.db_file = db_file; self._read_conn = None; self._write_conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+        self._upgrade(conn); conn.executescript(HISTORY_SCHEMA); conn.execute(f"PRAGMA user_version = {HISTORY_SCHEMA_VERSION}")
+        return conn
+
+    def _upgrade(self, conn):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= HISTORY_SCHEMA_VERSION: return
+        if "hash" not in {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}: return # базы ещё нет
+        conn.execute("BEGIN IMMEDIATE") # соединения потоков GUI и записи не должны мигрировать одновременно
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= HISTORY_SCHEMA_VERSION: conn.rollback(); return
+            conn.execute("ALTER TABLE chunks RENAME TO chunks_v0"); conn.execute("ALTER TABLE revisions RENAME TO revisions_v0"); conn.execute("DROP INDEX idx_revisions_note")
+            for statement in HISTORY_SCHEMA.split(";"):
+                if statement.strip(): conn.execute(statement)
+            ids = {chunk_hash: conn.execute("INSERT INTO chunks(digest, data) VALUES (?, ?)", (bytes.fromhex(chunk_hash), data)).lastrowid
+                   for chunk_hash, data in conn.execute("SELECT hash, data FROM chunks_v0").fetchall()}
+            for revision_id, note_id, saved_at, content_hash, size, chunks in conn.execute("SELECT id, note_id, saved_at, content_hash, size, chunks FROM revisions_v0").fetchall():
+                conn.execute("INSERT INTO revisions(id, note_id, saved_at, content_hash, size, chunks) VALUES (?, ?, ?, ?, ?, ?)",
+                             (revision_id, note_id, saved_at, bytes.fromhex(content_hash), size, pack_chunk_ids([ids[h] for h in chunks.split()])))
+            conn.execute("DROP TABLE chunks_v0"); conn.execute("DROP TABLE revisions_v0")
+            conn.execute(f"PRAGMA user_version = {HISTORY_SCHEMA_VERSION}"); conn.commit()
+        except Exception: conn.rollback(); raise
+
+    def record(self, note, previous=None):
+        # previous - заметка до изменения: если истории ещё нет, она станет первой версией.
+        # Ключ уникален для каждого вызова: слияние задач потока записи отбросило бы более ранние версии
+        note = dict(note); previous = dict(previous) if previous else None
+        self.writer.submit(f"{self.db_file}:{note['id']}:{uuid.uuid4().hex}", lambda: self._write(note, previous))
+
+    def _write(self, note, previous):
+        if self._write_conn is None: self._write_conn = self._connect()
+        conn = self._write_conn
+        with conn:
+            last = conn.execute("SELECT content_hash FROM revisions WHERE note_id = ? ORDER BY id DESC LIMIT 1", (note["id"],)).fetchone()
+            if last is None and previous and previous.get("text", "") != note.get("text", ""): last = self._insert(conn, previous, None)
+            self._insert(conn, note, last[0] if last else None)
+
+    def _insert(self, conn, note, last_hash):
+        text = note.get("text", ""); content_hash = hashlib.sha256(text.encode('utf-8')).digest()
+        if content_hash == last_hash: return (content_hash,)
+        ids = []
+        for chunk in chunk_text(text):
+            data = chunk.encode('utf-8'); digest = hashlib.sha256(data).digest()
+            row = conn.execute("SELECT id FROM chunks WHERE digest = ?", (digest,)).fetchone()
+            ids.append(row[0] if row else conn.execute("INSERT INTO chunks(digest, data) VALUES (?, ?)", (digest, zlib.compress(data))).lastrowid)
+        conn.execute("INSERT INTO revisions(note_id, saved_at, content_hash, size, chunks) VALUES (?, ?, ?, ?, ?)",
+                     (note["id"], note.get("modified") or note.get("created", ""), content_hash, len(text), pack_chunk_ids(ids)))
+        return (content_hash,)
+
+    def _reader(self):
+        if self._read_conn is None: self._read_conn = self._connect()
+        return self._read_conn
+
+    def revisions(self, note_id):
+        # [(id версии, время, размер)], новые первыми
+        return self._reader().execute("SELECT id, saved_at, size FROM revisions WHERE note_id = ? ORDER BY id DESC", (note_id,)).fetchall()
+
+    def text(self, revision_id):
+        conn = self._reader(); row = conn.execute("SELECT chunks FROM revisions WHERE id = ?", (revision_id,)).fetchone()
+        if row is None: return None
+        parts = []
+        for chunk_id in unpack_chunk_ids(row[0]):
+            parts.append(zlib.decompress(conn.execute("SELECT data FROM chunks WHERE id = ?", (chunk_id,)).fetchone()[0]).decode('utf-8'))
+        return "".join(parts)
+
+
+class MarkdownExporter(QThread):
+    # Экспорт заметок в фоне: один файл .md либо папка с файлом на каждую заметку, разложенными по тегам.
+    # В режиме папки .export_manifest.json хранит id -> (modified, путь), и повторный экспорт
+    # перезаписывает только изменившиеся заметки и удаляет файлы удалённых.
+    MANIFEST_NAME = ".export_manifest.json"
+    progress = pyqtSignal(int, int)
+    export_finished = pyqtSignal(bool, str)
+    def __init__(self, storage, path, per_note=False, parent=None):
+        super().__init__(parent)
+        self.storage = storage; self.path = path; self.per_note = per_note; self.cancelled = False
+
+    def cancel(self): self.cancelled = True
+
+    def run(self):
+        try: message = self.export_tree() if self.per_note else self.export_single()
+        except Exception as e: self.export_finished.emit(False, f"Не удалось экспортировать заметки: {e}"); return
+        self.export_finished.emit(True, message)
+
+    def export_single(self):
+        total = len(self.storage.notes); tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("# Экспорт заметок\n\n")
+            for done, note in enumerate(self.storage.iter_notes(), 1):
+                if self.cancelled: break
+                f.write(f"## Заметка от: {note.get('created', '')}\n\n{note.get('text', '')}\n\n---\n\n")
+                if done % 100 == 0: self.progress.emit(done, total)
+        if self.cancelled: remove_file(tmp_path); return "Экспорт отменён."
+        os.replace(tmp_path, self.path); self.progress.emit(total, total)
+        return f"Заметки успешно экспортированы в {self.path}"
+
+    def note_path(self, note):
+        tags = sorted(find_tags(note.get("text", "")))
+        folder = re.sub(r'[^\w\-]+', '_', tags[0]) if tags else "_без_тегов"
+        name = re.sub(r'[^\w\-]+', '-', note.get("created", "")).strip("-") or "note"
+        return os.path.join(folder, f"{name}-{note['id'][:8]}.md")
+
+    def export_tree(self):
+        manifest_path = os.path.join(self.path, self.MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError): manifest = {}
+        total = len(self.storage.notes); new_manifest = {}; written = skipped = 0
+        for done, note in enumerate(self.storage.iter_notes(), 1):
+            if self.cancelled: break
+            rel_path = self.note_path(note); entry = manifest.get(note["id"]); full_path = os.path.join(self.path, rel_path)
+            if entry and entry["modified"] == note.get("modified") and entry["path"] == rel_path and os.path.exists(full_path): skipped += 1
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, 'w', encoding='utf-8') as f: f.write(f"# {note.get('created', '')}\n\n{note.get('text', '')}\n")
+                if entry and entry["path"] != rel_path: remove_file(os.path.join(self.path, entry["path"]))
+                written += 1
+            new_manifest[note["id"]] = {"modified": note.get("modified"), "path": rel_path}
+            if done % 100 == 0: self.progress.emit(done, total)
+        if self.cancelled:
+            for note_id, entry in manifest.items(): new_manifest.setdefault(note_id, entry) # необработанные заметки остаются в манифесте
+        else:
+            for note_id, entry in manifest.items():
+                if note_id not in new_manifest: remove_file(os.path.join(self.path, entry["path"]))
+        write_json_atomic(manifest_path, new_manifest, indent=None)
+        self.progress.emit(total, total)
+        status = "Экспорт отменён" if self.cancelled else "Экспорт завершён"
+        return f"{status}: записано {written}, без изменений {skipped}.\nПапка: {self.path}"
+
+
+def parse_note_time(value):
+    for fmt in (NOTE_TIME_FORMAT, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try: return datetime.strptime(value[:19], fmt).strftime(NOTE_TIME_FORMAT)
+        except ValueError: continue
+    return None
+
+def parse_note_file(raw, fallback_created):
+    # Front-matter (--- ... ---) с полями created/date и tags, либо заголовок "# <дата>" из экспорта
+    # "файл на заметку". Теги из front-matter дописываются в текст как #тег, чтобы их нашёл find_tags.
+    text = raw.replace('\r\n', '\n').lstrip('\ufeff'); created = None; extra_tags = []
+    if text.startswith('---\n'):
+        end = text.find('\n---', 4)
+        if end != -1:
+            for line in text[4:end].splitlines():
+                key, sep, value = line.partition(':')
+                if not sep: continue
+                key = key.strip().lower(); value = value.strip().strip('"\'')
+                if key in ('created', 'date', 'timestamp'): created = parse_note_time(value) or created
+                elif key in ('tags', 'tag'): extra_tags += [t.strip().strip('"\'').lstrip('#') for t in value.strip('[]').split(',') if t.strip()]
+            text = text[end + 4:]
+    heading = re.match(r'\s*#\s+(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\s*\n', text)
+    if heading and created is None: created = heading.group(1); text = text[heading.end():]
+    text = text.strip(); tags = find_tags(text)
+    missing = [t for t in extra_tags if re.fullmatch(r'\w+', t) and t not in tags]
+    if missing: text = (text + "\n\n" if text else "") + " ".join(f"#{t}" for t in missing)
+    return text, created or fallback_created
+
+class MarkdownImporter(QThread):
+    # Импорт папки .md/.txt в фоне. Заметки отдаются пачками по BATCH_SIZE (batch_ready), чтобы хранилище,
+    # индексы и список обновлялись раз на пачку. Дубликаты отсекаются по sha256 текста, поэтому
+    # повторный импорт той же папки ничего не добавляет.
+    EXTENSIONS = (".md", ".markdown", ".txt")
+    BATCH_SIZE = 200
+    progress = pyqtSignal(int, int)
+    batch_ready = pyqtSignal(list)
+    import_finished = pyqtSignal(bool, str)
+    def __init__(self, storage, directory, parent=None):
+        super().__init__(parent)
+        self.storage = storage; self.directory = directory; self.cancelled = False
+
+    def cancel(self): self.cancelled = True
+
+    def run(self):
+        try: message = self.import_directory()
+        except Exception as e: self.import_finished.emit(False, f"Не удалось импортировать заметки: {e}"); return
+        self.import_finished.emit(True, message)
+
+    def import_directory(self):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(self.directory) for name in names if name.lower().endswith(self.EXTENSIONS))
+        total = len(paths); self.progress.emit(0, total)
+        known = {hashlib.sha256(note.get("text", "").strip().encode('utf-8')).hexdigest() for note in self.storage.iter_notes()}
+        batch = []; imported = duplicates = failed = 0
+        for done, path in enumerate(paths, 1):
+            if self.cancelled: break
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f: raw = f.read()
+                fallback_created = datetime.fromtimestamp(os.path.getmtime(path)).strftime(NOTE_TIME_FORMAT)
+            except OSError as e: print(f"Не удалось прочитать {path}: {e}"); failed += 1; continue
+            text, created = parse_note_file(raw, fallback_created)
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            if not text or digest in known: duplicates += bool(text); continue
+            known.add(digest); note = new_note(text); note.update(created=created, modified=created); batch.append(note); imported += 1
+            if len(batch) >= self.BATCH_SIZE: self.batch_ready.emit(batch); batch = []
+            if done % 50 == 0: self.progress.emit(done, total)
+        if batch: self.batch_ready.emit(batch)
+        self.progress.emit(total, total)
+        status = "Импорт отменён" if self.cancelled else "Импорт завершён"
+        return f"{status}: добавлено {imported}, дубликатов {duplicates}, ошибок чтения {failed}."
+
+
+STORAGE_BACKENDS = {
+    "sqlite": SqliteStorage,
+    "journal": JournalStorage,
+    "json": lambda writer: JournalStorage(writer, journaled=False),
+}
+
+def create_storage(mode, writer):
+    factory = STORAGE_BACKENDS.get(mode)
+    if factory is None: print(f"Неизвестный режим хранения '{mode}', используется sqlite."); factory = SqliteStorage
+    return factory(writer)
 
 # --- Локализация ---
 class LocalizationManager(QObject):
@@ -42,105 +1013,507 @@ class LocalizationManager(QObject):
         try: base_path = sys._MEIPASS
         except AttributeError: base_path = os.path.dirname(os.path.abspath(__file__))
         self.locales_dir = os.path.join(base_path, "locales")
-        self.translations = {}
-        self._ensure_locales_exist()
-        self.available_languages = self._scan_languages()
+        self.manifest_path = os.path.join(self.locales_dir, LOCALE_MANIFEST_FILE)
+        self.translations = {}; self._loaded = {} # код языка -> (подпись файла, переводы)
+        self.builtin_translations = self._builtin_translations()
+        self._available_languages = None # манифест читается только когда нужен список языков
         self.current_lang = default_lang
-        
-    def _ensure_locales_exist(self):
 
-        if not os.path.isdir(self.locales_dir):
-            os.makedirs(self.locales_dir)
+    @property
+    def available_languages(self):
+        if self._available_languages is None: self._available_languages = self._scan_languages()
+        return self._available_languages
         
-        ru_path = os.path.join(self.locales_dir, 'ru_RU.json')
-        if not os.path.exists(ru_path):
-            ru_data = {
-                "lang_name": "Русский",
-                "add_task_button": "Добавить", "new_task_placeholder": "Новая задача...",
-                "hide_completed_checkbox": "Скрыть выполненные",
-                "delete_note_tooltip": "Удалить заметку", "delete_task_tooltip": "Удалить задачу",
-                "notes_editor_label": "Редактор заметок:", "save_button": "Сохранить",
-                "new_note_button": "Новая", "zen_button": "Zen", "search_placeholder": "Поиск по тексту...",
-                "all_tags_combo": "Все теги", "new_note_placeholder": "Начните писать...",
-                "unsaved_changes_status": "Несохраненные изменения...", "data_saved_status": "Данные сохранены",
-                "word_count_label": "Слов",
-                "pomodoro_label": "Pomodoro:", "pomodoro_start_btn": "Старт", "pomodoro_pause_btn": "Пауза", "pomodoro_reset_btn": "Сброс",
-                "about_menu": "О программе...", "export_menu": "Экспорт заметок в Markdown...",
-                "restore_menu": "Восстановить из резервной копии...", "exit_menu": "Выход",
-                "add_list_menu": "Добавить список...", "rename_list_menu": "Переименовать список...", "delete_list_menu": "Удалить список...",
-                "new_list_prompt": "Введите имя нового списка:", "rename_list_prompt": "Введите новое имя для списка:", "delete_list_confirm": "Вы уверены, что хотите удалить список '{list_name}'?",
-                "settings_title": "Настройки", "settings_tab_general": "Общие", "settings_tab_appearance": "Оформление", "settings_tab_zen": "Редактор Zen",
-                "settings_lang_label": "Язык:", "settings_theme_label": "Основная тема:",
-                "settings_light_theme": "Светлая", "settings_dark_theme": "Тёмная",
-                "settings_trigger_pos_label": "Позиция кнопки:", "settings_trigger_left": "Слева", "settings_trigger_right": "Справа",
-                "settings_accent_color_label": "Акцентный цвет:", "settings_choose_color_btn": "Выбрать цвет...",
-                "settings_light_theme_bg_label": "Фон светлой темы:", "settings_light_theme_text_label": "Текст светлой темы:",
-                "settings_dark_theme_bg_label": "Фон тёмной темы:", "settings_dark_theme_text_label": "Текст тёмной темы:",
-                "settings_light_theme_list_text_label": "Текст списков (светлая):", "settings_dark_theme_list_text_label": "Текст списков (тёмная):",
-                "settings_zen_bg_label": "Фон Zen:", "settings_browse_btn": "Обзор...", "settings_clear_btn": "Очистить",
-                "settings_transparent_editor": "Прозрачный редактор", "settings_font_label": "Шрифт:", "settings_size_label": "Размер:",
-                "settings_font_color_label": "Цвет шрифта:", "settings_alignment_label": "Выравнивание:",
-                "settings_align_left": "По левому краю", "settings_align_justify": "По ширине",
-                "settings_padding_horiz": "Гор. отступ (%):", "settings_padding_vert": "Верт. отступ (%):",
-                "settings_first_line_indent": "Отступ 1-й строки (px):",
-                "task_menu_edit": "Редактировать...",
-                "task_menu_toggle_completed": "Отметить/Снять отметку"
-            }
-            with open(ru_path, 'w', encoding='utf-8') as f: json.dump(ru_data, f, ensure_ascii=False, indent=2)
-
-        en_path = os.path.join(self.locales_dir, 'en_US.json')
-        if not os.path.exists(en_path):
-            en_data = {
-                "lang_name": "English", "add_task_button": "Add", "new_task_placeholder": "New task...", "hide_completed_checkbox": "Hide completed",
-                "delete_note_tooltip": "Delete note", "delete_task_tooltip": "Delete task", "notes_editor_label": "Notes Editor:", "save_button": "Save",
-                "new_note_button": "New", "zen_button": "Zen", "search_placeholder": "Search in text...", "all_tags_combo": "All tags",
-                "new_note_placeholder": "Start writing...", "unsaved_changes_status": "Unsaved changes...", "data_saved_status": "Data saved",
-                "word_count_label": "Words", "pomodoro_label": "Pomodoro:", "pomodoro_start_btn": "Start", "pomodoro_pause_btn": "Pause", "pomodoro_reset_btn": "Reset",
-                "about_menu": "About...", "export_menu": "Export Notes to Markdown...", "restore_menu": "Restore from Backup...", "exit_menu": "Exit",
-                "add_list_menu": "Add List...", "rename_list_menu": "Rename List...", "delete_list_menu": "Delete List...",
-                "new_list_prompt": "Enter new list name:", "rename_list_prompt": "Enter new name for the list:", "delete_list_confirm": "Are you sure you want to delete list '{list_name}'?",
-                "settings_title": "Settings", "settings_tab_general": "General", "settings_tab_appearance": "Appearance", "settings_tab_zen": "Zen Editor",
-                "settings_lang_label": "Language:", "settings_theme_label": "Main theme:", "settings_light_theme": "Light", "settings_dark_theme": "Dark",
-                "settings_trigger_pos_label": "Button position:", "settings_trigger_left": "Left", "settings_trigger_right": "Right",
-                "settings_accent_color_label": "Accent color:", "settings_choose_color_btn": "Choose color...",
-                "settings_light_theme_bg_label": "Light theme BG:", "settings_light_theme_text_label": "Light theme Text:", "settings_dark_theme_bg_label": "Dark theme BG:",
-                "settings_dark_theme_text_label": "Dark theme Text:", "settings_light_theme_list_text_label": "List text (light):", "settings_dark_theme_list_text_label": "List text (dark):",
-                "settings_zen_bg_label": "Zen Background:", "settings_browse_btn": "Browse...", "settings_clear_btn": "Clear",
-                "settings_transparent_editor": "Transparent editor", "settings_font_label": "Font:", "settings_size_label": " :", "settings_font_color_label": "Font Color:",
-                "settings_alignment_label": "Alignment:", "settings_align_left": "Left", "settings_align_justify": "Justify",
-                "settings_padding_horiz": "Horiz. Padding (%):", "settings_padding_vert": "Vert. Padding (%):", "settings_first_line_indent": "1st line indent (px):",
-                "task_menu_edit": "Edit...", "task_menu_toggle_completed": "Toggle completed"
-            }
-            with open(en_path, 'w', encoding='utf-8') as f: json.dump(en_data, f, ensure_ascii=False, indent=2)
+    def _builtin_translations(self):
+        ru_data = {
+            "lang_name": "Русский",
+            "add_task_button": "Добавить", "new_task_placeholder": "Новая задача...",
+            "hide_completed_checkbox": "Скрыть выполненные",
+            "delete_note_tooltip": "Удалить заметку", "delete_task_tooltip": "Удалить задачу",
+            "note_history_menu": "История версий...", "note_history_title": "История версий заметки",
+            "restore_revision_button": "Восстановить эту версию", "no_revisions_label": "Для этой заметки ещё нет сохранённых версий.",
+            "notes_editor_label": "Редактор заметок:", "save_button": "Сохранить",
+            "new_note_button": "Новая", "zen_button": "Zen", "search_placeholder": "Поиск по тексту...",
+            "all_tags_combo": "Все теги", "new_note_placeholder": "Начните писать...",
+            "unsaved_changes_status": "Несохраненные изменения...", "data_saved_status": "Данные сохранены",
+            "word_count_label": "Слов", "char_count_label": "Символов", "paragraph_count_label": "Абзацев", "session_words_label": "За сессию",
+            "pomodoro_label": "Pomodoro:", "pomodoro_start_btn": "Старт", "pomodoro_pause_btn": "Пауза", "pomodoro_reset_btn": "Сброс",
+            "about_menu": "О программе...", "export_menu": "Экспорт заметок в Markdown...", "import_menu": "Импорт заметок из папки...",
+            "restore_menu": "Восстановить из резервной копии...", "exit_menu": "Выход",
+            "add_list_menu": "Добавить список...", "rename_list_menu": "Переименовать список...", "delete_list_menu": "Удалить список...",
+            "new_list_prompt": "Введите имя нового списка:", "rename_list_prompt": "Введите новое имя для списка:", "delete_list_confirm": "Вы уверены, что хотите удалить список '{list_name}'?",
+            "settings_title": "Настройки", "settings_tab_general": "Общие", "settings_tab_appearance": "Оформление", "settings_tab_zen": "Редактор Zen",
+            "settings_lang_label": "Язык:", "settings_theme_label": "Основная тема:",
+            "settings_light_theme": "Светлая", "settings_dark_theme": "Тёмная",
+            "settings_trigger_pos_label": "Позиция кнопки:", "settings_trigger_left": "Слева", "settings_trigger_right": "Справа",
+            "settings_accent_color_label": "Акцентный цвет:", "settings_choose_color_btn": "Выбрать цвет...",
+            "settings_light_theme_bg_label": "Фон светлой темы:", "settings_light_theme_text_label": "Текст светлой темы:",
+            "settings_dark_theme_bg_label": "Фон тёмной темы:", "settings_dark_theme_text_label": "Текст тёмной темы:",
+            "settings_light_theme_list_text_label": "Текст списков (светлая):", "settings_dark_theme_list_text_label": "Текст списков (тёмная):",
+            "settings_zen_bg_label": "Фон Zen:", "settings_browse_btn": "Обзор...", "settings_clear_btn": "Очистить",
+            "settings_transparent_editor": "Прозрачный редактор", "settings_font_label": "Шрифт:", "settings_size_label": "Размер:",
+            "settings_font_color_label": "Цвет шрифта:", "settings_alignment_label": "Выравнивание:",
+            "settings_align_left": "По левому краю", "settings_align_justify": "По ширине",
+            "settings_padding_horiz": "Гор. отступ (%):", "settings_padding_vert": "Верт. отступ (%):",
+            "settings_first_line_indent": "Отступ 1-й строки (px):",
+            "settings_notes_autosave_label": "Автосохранение заметок через (с, 0 - выкл.):",
+            "task_menu_edit": "Редактировать...",
+            "task_menu_toggle_completed": "Отметить/Снять отметку",
+            "task_menu_due": "Срок...", "task_due_prompt": "Срок (ГГГГ-ММ-ДД, пусто - без срока):", "task_due_invalid": "Неверная дата: {value}",
+            "task_menu_priority": "Приоритет", "task_priority_0": "Нет", "task_priority_1": "Низкий", "task_priority_2": "Средний", "task_priority_3": "Высокий",
+            "task_due_tooltip": "Срок: {due}", "task_created_tooltip": "Создана: {time}", "task_completed_tooltip": "Выполнена: {time}",
+            "task_view_today": "Сегодня", "task_view_overdue": "Просроченные", "task_view_open": "Все открытые",
+            "task_sort_menu": "Сортировка", "task_sort_manual": "По порядку добавления", "task_sort_due": "По сроку", "task_sort_priority": "По приоритету"
+        }
+        en_data = {
+            "lang_name": "English", "add_task_button": "Add", "new_task_placeholder": "New task...", "hide_completed_checkbox": "Hide completed",
+            "delete_note_tooltip": "Delete note", "delete_task_tooltip": "Delete task", "notes_editor_label": "Notes Editor:", "save_button": "Save",
+            "note_history_menu": "Version history...", "note_history_title": "Note version history",
+            "restore_revision_button": "Restore this version", "no_revisions_label": "No saved versions of this note yet.",
+            "new_note_button": "New", "zen_button": "Zen", "search_placeholder": "Search in text...", "all_tags_combo": "All tags",
+            "new_note_placeholder": "Start writing...", "unsaved_changes_status": "Unsaved changes...", "data_saved_status": "Data saved",
+            "word_count_label": "Words", "char_count_label": "Characters", "paragraph_count_label": "Paragraphs", "session_words_label": "This session",
+            "pomodoro_label": "Pomodoro:", "pomodoro_start_btn": "Start", "pomodoro_pause_btn": "Pause", "pomodoro_reset_btn": "Reset",
+            "about_menu": "About...", "export_menu": "Export Notes to Markdown...", "import_menu": "Import Notes from Folder...", "restore_menu": "Restore from Backup...", "exit_menu": "Exit",
+            "add_list_menu": "Add List...", "rename_list_menu": "Rename List...", "delete_list_menu": "Delete List...",
+            "new_list_prompt": "Enter new list name:", "rename_list_prompt": "Enter new name for the list:", "delete_list_confirm": "Are you sure you want to delete list '{list_name}'?",
+            "settings_title": "Settings", "settings_tab_general": "General", "settings_tab_appearance": "Appearance", "settings_tab_zen": "Zen Editor",
+            "settings_lang_label": "Language:", "settings_theme_label": "Main theme:", "settings_light_theme": "Light", "settings_dark_theme": "Dark",
+            "settings_trigger_pos_label": "Button position:", "settings_trigger_left": "Left", "settings_trigger_right": "Right",
+            "settings_accent_color_label": "Accent color:", "settings_choose_color_btn": "Choose color...",
+            "settings_light_theme_bg_label": "Light theme BG:", "settings_light_theme_text_label": "Light theme Text:", "settings_dark_theme_bg_label": "Dark theme BG:",
+            "settings_dark_theme_text_label": "Dark theme Text:", "settings_light_theme_list_text_label": "List text (light):", "settings_dark_theme_list_text_label": "List text (dark):",
+            "settings_zen_bg_label": "Zen Background:", "settings_browse_btn": "Browse...", "settings_clear_btn": "Clear",
+            "settings_transparent_editor": "Transparent editor", "settings_font_label": "Font:", "settings_size_label": " :", "settings_font_color_label": "Font Color:",
+            "settings_alignment_label": "Alignment:", "settings_align_left": "Left", "settings_align_justify": "Justify",
+            "settings_padding_horiz": "Horiz. Padding (%):", "settings_padding_vert": "Vert. Padding (%):", "settings_first_line_indent": "1st line indent (px):",
+            "settings_notes_autosave_label": "Autosave notes after idle (s, 0 = off):",
+            "task_menu_edit": "Edit...", "task_menu_toggle_completed": "Toggle completed",
+            "task_menu_due": "Due date...", "task_due_prompt": "Due date (YYYY-MM-DD, empty = none):", "task_due_invalid": "Invalid date: {value}",
+            "task_menu_priority": "Priority", "task_priority_0": "None", "task_priority_1": "Low", "task_priority_2": "Medium", "task_priority_3": "High",
+            "task_due_tooltip": "Due: {due}", "task_created_tooltip": "Created: {time}", "task_completed_tooltip": "Completed: {time}",
+            "task_view_today": "Due today", "task_view_overdue": "Overdue", "task_view_open": "All open",
+            "task_sort_menu": "Sort", "task_sort_manual": "In order added", "task_sort_due": "By due date", "task_sort_priority": "By priority"
+        }
+        return {"ru_RU": ru_data, "en_US": en_data}
+
+    def _locale_files(self):
+        # имя файла -> [mtime_ns, размер]; служебные файлы (.manifest.json) пропускаются
+        files = {}
+        with os.scandir(self.locales_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and not entry.name.startswith("."):
+                    stat = entry.stat(); files[entry.name] = [stat.st_mtime_ns, stat.st_size]
+        return files
 
     def _scan_languages(self):
-        langs = {}
-        if not os.path.isdir(self.locales_dir): return {}
-        for filename in os.listdir(self.locales_dir):
-            if filename.endswith(".json"):
-                lang_code = filename[:-5]
+        # Названия языков берутся из манифеста; разбирается только файл, у которого изменились mtime/размер
+        try:
+            os.makedirs(self.locales_dir, exist_ok=True); files = self._locale_files()
+            missing = [code for code in self.builtin_translations if f"{code}.json" not in files]
+            for code in missing:
+                with open(os.path.join(self.locales_dir, f"{code}.json"), 'w', encoding='utf-8') as f: json.dump(self.builtin_translations[code], f, ensure_ascii=False, indent=2)
+            if missing: files = self._locale_files()
+        except OSError as e:
+            print(f"Could not scan locales: {e}")
+            return {code: data["lang_name"] for code, data in self.builtin_translations.items()}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+        except (OSError, json.JSONDecodeError): manifest = {}
+        langs = {}; new_manifest = {}
+        for filename, signature in sorted(files.items()):
+            lang_code = filename[:-5]; cached = manifest.get(filename)
+            if cached and cached[:2] == signature: lang_name = cached[2]
+            else:
                 try:
-                    with open(os.path.join(self.locales_dir, filename), 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        langs[lang_code] = data.get("lang_name", lang_code)
-                except Exception as e: print(f"Could not load language file {filename}: {e}")
+                    data = self._read_locale(lang_code); lang_name = data.get("lang_name", lang_code)
+                    self._loaded[lang_code] = (signature, data) # уже разобран - при выборе не читаем повторно
+                except Exception as e: print(f"Could not load language file {filename}: {e}"); continue
+            langs[lang_code] = lang_name; new_manifest[filename] = signature + [lang_name]
+        if new_manifest != manifest:
+            try: write_json_atomic(self.manifest_path, new_manifest, indent=None)
+            except OSError as e: print(f"Could not write locale manifest: {e}")
         return langs
+
+    def _read_locale(self, lang_code):
+        with open(os.path.join(self.locales_dir, f"{lang_code}.json"), 'r', encoding='utf-8') as f: return json.load(f)
         
     def set_language(self, lang_code):
         path = os.path.join(self.locales_dir, f"{lang_code}.json")
-        if os.path.exists(path):
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    self.translations = json.load(f)
-                self.current_lang = lang_code
-                self.language_changed.emit()
-            except Exception as e: print(f"Error loading language {lang_code}: {e}")
-        else: print(f"Language file for {lang_code} not found.")
+        try: stat = os.stat(path)
+        except OSError:
+            if lang_code not in self.builtin_translations: print(f"Language file for {lang_code} not found."); return
+            data = {}
+        else:
+            signature = [stat.st_mtime_ns, stat.st_size]; cached = self._loaded.get(lang_code)
+            if cached and cached[0] == signature: data = cached[1]
+            else:
+                try: data = self._read_locale(lang_code)
+                except Exception as e: print(f"Error loading language {lang_code}: {e}"); return
+                self._loaded[lang_code] = (signature, data)
+        # Ключи, которых нет в старом файле на диске, берутся из встроенного перевода
+        self.translations = {**self.builtin_translations.get(lang_code, {}), **data}
+        self.current_lang = lang_code
+        self.language_changed.emit()
 
     def get(self, key, default_text=""):
         return self.translations.get(key, default_text or key)
 
 
+# --- Оформление ---
+# Шаблоны таблиц стилей: подставляются значения палитры ThemeEngine (и дополнительные значения шаблона)
+MAIN_POPUP_STYLE = """
+    QWidget#MainPopup {{ 
+        background-color: {bg_color}; 
+    }}
+    QWidget {{
+        color: {text_color};
+    }} 
+    QLabel {{ 
+        background-color: transparent; 
+    }} 
+    QLabel#titleLabel {{ 
+        font-size: 14px; font-weight: bold; 
+    }} 
+    QLineEdit, QTextEdit, QComboBox {{ 
+        background-color: {component_bg}; 
+        border: 1px solid {border_color}; 
+        border-radius: 4px; padding: 5px; 
+    }} 
+    QListView {{ 
+        background-color: {component_bg}; 
+        border: 1px solid {border_color}; 
+    }}
+    QListView:focus {{
+        outline: none;
+    }}
+
+    /* --- Стилизация элементов списка --- */
+    QListView::item {{
+        color: {list_text_color};
+        padding: 5px; 
+        border-radius: 4px;
+    }}
+    QListView::item:hover {{
+        background-color: rgba(128, 128, 128, 0.15);
+    }}
+
+    /* --- ОТКЛЮЧАЕМ ВЫДЕЛЕНИЕ В СПИСКЕ ЗАДАЧ --- */
+    QListView#TaskList::item:selected {{
+        background-color: transparent;
+        color: {list_text_color};
+    }}
+
+    QListView::item:selected {{
+        background-color: {accent_color};
+        color: white;
+    }}
+
+    /* --- Стилизация индикатора (галочки) в списке ЗАДАЧ --- */
+    QListView::indicator {{
+        width: 14px;
+        height: 14px;
+        border: 1px solid {border_color};
+        border-radius: 3px;
+        background-color: {component_bg};
+    }}
+    QListView::indicator:checked {{
+        background-color: {accent_color};
+        border-color: {accent_dark};
+        /* image: url(:/qt-project.org/styles/commonstyle/images/standardbutton-apply-16.png); */
+    }}
+
+    QListView::item:checked {{
+        color: gray;
+    }}
+    QListView#TaskList::item:selected:checked {{
+        color: gray;
+    }}
+    QListView::item:selected:checked {{
+        color: white;
+    }}
+
+    QPushButton {{ 
+        background-color: {component_bg}; 
+        color: {text_color};
+        border: 1px solid {border_color}; 
+        padding: 5px 10px; border-radius: 4px; 
+    }} 
+    QCheckBox::indicator {{
+        width: 14px;
+        height: 14px;
+        border: 1px solid {border_color};
+        background-color: {component_bg};
+        border-radius: 3px;
+    }}
+    QCheckBox::indicator:checked {{
+        background-color: {accent_color};
+        border-color: {accent_dark};
+    }}
+    QPushButton:hover {{ 
+        background-color: {component_hover}; 
+    }} 
+    QPushButton#save_button {{ 
+        background-color: {accent_color}; color: white; border-color: {accent_color}; font-weight: bold; 
+    }} 
+    QPushButton#close_button {{ 
+        font-family: 'Arial'; font-size: 14px; font-weight: bold; 
+        background-color: transparent; color: #888; border: none; 
+    }} 
+    QPushButton#close_button:hover {{ 
+        background-color: #dc3545; color: white; border-radius: 12px; 
+    }} 
+    QSplitter::handle {{ 
+        background-color: {border_color}; height: 3px; 
+    }}
+    QMenu {{
+        background-color: {component_bg};
+        color: {text_color};
+        border: 1px solid {border_color};
+        border-radius: 4px;
+        padding: 5px;
+    }}
+    QMenu::item {{
+        padding: 5px 25px 5px 20px;
+        border-radius: 4px;
+    }}
+    QMenu::item:selected {{
+        background-color: {accent_color};
+        color: white;
+    }}
+    QMenu::separator {{
+        height: 1px;
+        background: {border_color};
+        margin-left: 10px;
+        margin-right: 10px;
+    }}
+"""
+MENU_STYLE = """
+    QMenu {{
+        background-color: {component_bg};
+        color: {text_color};
+        border: 1px solid {border_color};
+        border-radius: 4px;
+        padding: 5px;
+    }}
+    QMenu::item {{
+        padding: 5px 25px 5px 20px;
+        border-radius: 4px;
+    }}
+    QMenu::item:selected {{
+        background-color: {accent_color};
+        color: white;
+    }}
+    QMenu::separator {{
+        height: 1px;
+        background: {border_color};
+        margin-left: 10px;
+        margin-right: 10px;
+    }}
+"""
+SETTINGS_PANEL_STYLE = """
+    QWidget#SettingsPanel {{ 
+        background-color: {panel_bg_rgba};
+        border-radius: 10px; color: {text_color};
+    }} 
+    QLabel, QCheckBox, QRadioButton {{ color: {text_color}; background: transparent;}} 
+
+    QCheckBox::indicator, QRadioButton::indicator {{
+        width: 14px;
+        height: 14px;
+        border: 1px solid #555;
+        background-color: {line_edit_bg};
+    }}
+    QCheckBox::indicator {{
+        border-radius: 3px;
+    }}
+    QRadioButton::indicator {{
+        border-radius: 7px; /* делаем круглой */
+    }}
+    QCheckBox::indicator:checked, QRadioButton::indicator:checked {{
+        background-color: {accent_color};
+        border-color: {accent_dark};
+    }}
+    QRadioButton::indicator:checked {{
+        /* Добавляем внутренний кружок для радио-кнопки */
+        image: url(:/qt-project.org/styles/commonstyle/images/radiobutton-on-16.png);
+    }}
+
+    QLineEdit, QSpinBox, QFontComboBox, QComboBox {{ 
+        background-color: {line_edit_bg}; border: 1px solid #555; 
+        color: {text_color}; padding: 4px; border-radius: 3px;
+    }} 
+    QComboBox QAbstractItemView {{
+        background-color: {line_edit_bg};
+        color: {text_color};
+        border: 1px solid #555;
+        selection-background-color: {accent_color};
+        outline: 0px; /* Убирает рамку выделения */
+    }}
+    QPushButton {{ 
+        background-color: {button_bg}; color: {text_color}; 
+        border: 1px solid #555; padding: 4px 8px; border-radius: 3px;
+    }} 
+    QPushButton:hover {{ background-color: #555; }}
+    QTabWidget::pane {{ border: 1px solid #444; }}
+    QTabBar::tab {{ 
+        background: {tab_bg}; 
+        color: {text_color}; padding: 8px 12px;
+        border-top-left-radius: 4px; border-top-right-radius: 4px;
+    }}
+    QTabBar::tab:selected, QTabBar::tab:hover {{
+        background: {tab_active_bg};
+    }}
+    QSpinBox::up-button {{ subcontrol-position: top right; width: 16px; }}
+    QSpinBox::down-button {{ subcontrol-position: bottom right; width: 16px; }}
+    QSpinBox::up-arrow, QSpinBox::down-arrow {{ width: 10px; height: 10px; }}
+"""
+ZEN_EDITOR_STYLE = """
+    QTextEdit {{
+        background-color: {editor_bg_rgba};
+        border: none;
+        font-family: '{font_family}';
+        font-size: {font_size}pt;
+        color: {editor_color};
+    }}
+
+    /* Стилизация вертикальной полосы прокрутки */
+    QScrollBar:vertical {{
+        border: none;
+        background: transparent; /* Фон самой полосы делаем прозрачным */
+        width: 8px; /* Ширина */
+        margin: 0px 0px 0px 0px;
+    }}
+
+    /* Стилизация ползунка */
+    QScrollBar::handle:vertical {{
+        background: {scrollbar_handle_color};
+        border-radius: 4px; /* Скругляем углы */
+        min-height: 25px; /* Минимальная высота ползунка */
+    }}
+
+    /* Ползунок при наведении */
+    QScrollBar::handle:vertical:hover {{
+        background: {scrollbar_handle_hover_color};
+    }}
+
+    /* Убираем кнопки со стрелками сверху и снизу */
+    QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{
+        border: none;
+        background: none;
+    }}
+    QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical {{
+        background: none;
+    }}
+"""
+ZEN_EXIT_BUTTON_STYLE = """
+    QPushButton {{
+        background: {floating_btn_bg}; 
+        color: {floating_btn_color};
+        border-radius: 16px;
+        border: none;
+        font-family: 'Arial'; 
+        font-size: 14pt; 
+        font-weight: bold;
+    }}
+    QPushButton:hover {{
+        background-color: #dc3545;
+        color: white;
+    }}
+"""
+ZEN_AUDIO_PANEL_STYLE = 'QWidget#audioPanel {{ background: {zen_panel_bg}; border-radius: 15px; }} QPushButton {{ border: 1px solid {btn_border}; border-radius: 15px; background-color: {btn_bg}; color: {btn_color}; font-size: 11pt; font-weight: bold; }} QPushButton:hover {{ background-color: {btn_hover_bg}; }} QPushButton[playing="true"] {{ background-color: {accent_color}; border-color: #ffffff; color: white; }}'
+ZEN_SETTINGS_BUTTON_STYLE = "background: {floating_btn_bg}; border-radius: 16px;"
+ZEN_POMODORO_TITLE_STYLE = "background-color: transparent; color: {zen_text_color}; font-weight:bold;"
+ZEN_POMODORO_LABEL_STYLE = "background-color: transparent; font-size: 14pt; font-weight: bold; color: {zen_text_color};"
+ZEN_POMODORO_BUTTON_STYLE = "background-color: transparent; border: none; font-size: 10pt; color: {zen_text_color}; padding: 2px 5px; QPushButton:hover {{ background-color: {pomodoro_button_bg}; border-radius: 5px; }}"
+ZEN_WORD_COUNT_STYLE = "background-color: transparent; border: none; color: {zen_text_color}; padding: 5px;"
+TRIGGER_BUTTON_STYLE = "QPushButton#trigger_button {{ background-color: {accent_color}; color: white; font-size: 14px; font-weight: bold;{trigger_corners} }} QPushButton#trigger_button:hover {{ opacity: 0.8; }}"
+
+class ThemeEngine:
+    # Палитра выводится из настроек темы один раз на набор значений, таблицы стилей собираются из шаблонов *_STYLE
+    # и запоминаются по отпечатку: значениям ключей темы плюс дополнительных ключей шаблона.
+    # apply() не вызывает setStyleSheet, если итоговая строка не изменилась: иначе Qt заново разбирает
+    # стиль и переполирует всё дерево виджетов.
+    PALETTE_KEYS = tuple(sorted(THEME_SETTING_KEYS))
+    TEMPLATES = { # имя -> (шаблон, дополнительные ключи настроек)
+        "main_popup": (MAIN_POPUP_STYLE, ()), "menu": (MENU_STYLE, ()), "settings_panel": (SETTINGS_PANEL_STYLE, ()),
+        "zen_editor": (ZEN_EDITOR_STYLE, ("zen_font_family", "zen_font_size", "zen_font_color", "zen_editor_transparent")),
+        "zen_exit_button": (ZEN_EXIT_BUTTON_STYLE, ()), "zen_audio_panel": (ZEN_AUDIO_PANEL_STYLE, ()), "zen_settings_button": (ZEN_SETTINGS_BUTTON_STYLE, ()),
+        "zen_pomodoro_title": (ZEN_POMODORO_TITLE_STYLE, ()), "zen_pomodoro_label": (ZEN_POMODORO_LABEL_STYLE, ()),
+        "zen_pomodoro_button": (ZEN_POMODORO_BUTTON_STYLE, ()), "zen_word_count": (ZEN_WORD_COUNT_STYLE, ()),
+        "trigger_button": (TRIGGER_BUTTON_STYLE, ("trigger_pos",)),
+    }
+    MAX_CACHED = 64
+    def __init__(self): self._palettes = {}; self._sheets = {}
+
+    def palette(self, settings):
+        key = tuple(settings.get(k) for k in self.PALETTE_KEYS)
+        palette = self._palettes.get(key)
+        if palette is None:
+            if len(self._palettes) >= self.MAX_CACHED: self._palettes.clear()
+            palette = self._palettes[key] = self._derive_palette(settings)
+        return key, palette
+
+    @staticmethod
+    def _derive_palette(settings):
+        is_dark = settings.get("theme", "light") == "dark"
+        accent_color = settings.get("accent_color", "#007bff")
+        bg_color = settings.get("dark_theme_bg") if is_dark else settings.get("light_theme_bg")
+        component_bg = QColor(bg_color).lighter(115).name() if is_dark else QColor(bg_color).darker(105).name()
+        panel_bg = QColor(bg_color); panel_bg.setAlpha(245)
+        return {
+            "is_dark": is_dark, "accent_color": accent_color, "accent_dark": QColor(accent_color).darker(115).name(),
+            "bg_color": bg_color, "text_color": settings.get("dark_theme_text") if is_dark else settings.get("light_theme_text"),
+            "list_text_color": settings.get("dark_theme_list_text") if is_dark else settings.get("light_theme_list_text"),
+            "component_bg": component_bg, "component_hover": QColor(component_bg).lighter(110).name(), "border_color": "#555555" if is_dark else "#ced4da",
+            # Панель настроек
+            "panel_bg_rgba": f"rgba({panel_bg.red()}, {panel_bg.green()}, {panel_bg.blue()}, {panel_bg.alphaF()})",
+            "line_edit_bg": "rgba(0,0,0,0.3)" if is_dark else "rgba(255,255,255,0.7)", "button_bg": "rgba(80,80,80,1)" if is_dark else "#e1e1e1",
+            "tab_bg": "rgba(255,255,255,0.1)" if is_dark else "rgba(0,0,0,0.05)", "tab_active_bg": "rgba(255,255,255,0.2)" if is_dark else "rgba(0,0,0,0.1)",
+            # Zen
+            "scrollbar_handle_color": "rgba(255, 255, 255, 0.2)" if is_dark else "rgba(0, 0, 0, 0.2)",
+            "scrollbar_handle_hover_color": "rgba(255, 255, 255, 0.4)" if is_dark else "rgba(0, 0, 0, 0.4)",
+            "zen_panel_bg": "rgba(0,0,0,0.5)" if is_dark else "rgba(255,255,255,0.6)", "btn_border": "rgba(255,255,255,0.7)" if is_dark else "rgba(0,0,0,0.4)",
+            "btn_bg": "rgba(0,0,0,0.4)" if is_dark else "rgba(255,255,255,0.4)", "btn_color": "white" if is_dark else "black",
+            "btn_hover_bg": "rgba(255,255,255,0.3)" if is_dark else "rgba(0,0,0,0.1)",
+            "floating_btn_bg": "rgba(30,30,30,0.5)" if is_dark else "rgba(240,240,240,0.7)",
+            "floating_btn_color": "#e0e0e0" if is_dark else "#333333", # Светлый крестик для тёмной темы и наоборот
+            "zen_text_color": '#ccc' if is_dark else '#333', "pomodoro_button_bg": "rgba(255,255,255,0.1)" if is_dark else "rgba(0,0,0,0.05)",
+        }
+
+    def _template_values(self, name, palette, settings):
+        if name == "zen_editor":
+            editor_bg = QColor(palette["bg_color"])
+            if settings.get("zen_editor_transparent", True): editor_bg.setAlpha(20 if palette["is_dark"] else 215)
+            return {"font_family": settings.get("zen_font_family", "Georgia"), "font_size": settings.get("zen_font_size", 18),
+                    "editor_color": settings.get("zen_font_color") or palette["text_color"],
+                    "editor_bg_rgba": f"rgba({editor_bg.red()}, {editor_bg.green()}, {editor_bg.blue()}, {editor_bg.alphaF()})"}
+        if name == "trigger_button":
+            left = settings.get("trigger_pos", "right") == "left"
+            return {"trigger_corners": "border-top-right-radius: 5px; border-bottom-right-radius: 5px; border-left: none;" if left else "border-top-left-radius: 5px; border-bottom-left-radius: 5px; border-right: none;"}
+        return {}
+
+    def render(self, name, settings):
+        template, extra_keys = self.TEMPLATES[name]
+        palette_key, palette = self.palette(settings)
+        key = (name, palette_key, tuple(settings.get(k) for k in extra_keys))
+        sheet = self._sheets.get(key)
+        if sheet is None:
+            if len(self._sheets) >= self.MAX_CACHED: self._sheets.clear()
+            values = {**palette, **self._template_values(name, palette, settings)} if extra_keys else palette
+            sheet = self._sheets[key] = template.format(**values)
+        return sheet
+
+    @staticmethod
+    def set_style(widget, sheet):
+        if widget.styleSheet() == sheet: return False
+        widget.setStyleSheet(sheet); return True
+
+    def apply(self, widget, name, settings): return self.set_style(widget, self.render(name, settings))
+
+theme_engine = ThemeEngine()
+
+
 class NoteEditor(QTextEdit):
     save_and_new_requested = pyqtSignal()
     def keyPressEvent(self, event: QKeyEvent):
@@ -148,6 +1521,30 @@ class NoteEditor(QTextEdit):
             self.save_and_new_requested.emit()
         else: super().keyPressEvent(event)
 
+class NoteHistoryDialog(QDialog):
+    # Список версий заметки слева, текст выбранной версии справа
+    def __init__(self, history, note_id, loc_manager, parent=None):
+        super().__init__(parent)
+        self.history = history; self.loc = loc_manager; self.selected_text = None
+        self.setWindowTitle(self.loc.get("note_history_title", "История версий заметки")); self.resize(640, 420)
+        layout = QVBoxLayout(self); splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.revision_list = QListWidget(); self.preview = QTextEdit(); self.preview.setReadOnly(True)
+        splitter.addWidget(self.revision_list); splitter.addWidget(self.preview); splitter.setSizes([200, 440])
+        layout.addWidget(splitter, 1)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        self.restore_button = buttons.addButton(self.loc.get("restore_revision_button", "Восстановить эту версию"), QDialogButtonBox.ButtonRole.AcceptRole)
+        buttons.accepted.connect(self.accept); buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        for revision_id, saved_at, size in self.history.revisions(note_id):
+            item = QListWidgetItem(f"{saved_at}  ({size})"); item.setData(Qt.ItemDataRole.UserRole, revision_id); self.revision_list.addItem(item)
+        self.revision_list.currentItemChanged.connect(self.show_revision)
+        if self.revision_list.count(): self.revision_list.setCurrentRow(0)
+        else: self.preview.setPlainText(self.loc.get("no_revisions_label", "Для этой заметки ещё нет сохранённых версий.")); self.restore_button.setEnabled(False)
+
+    def show_revision(self, current, previous):
+        self.selected_text = self.history.text(current.data(Qt.ItemDataRole.UserRole)) if current else None
+        self.preview.setPlainText(self.selected_text or "")
+
 class AboutDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -203,14 +1600,122 @@ class AboutDialog(QDialog):
         buttons.accepted.connect(self.accept)
         layout.addWidget(buttons)
 
+class TaskListModel(QAbstractListModel):
+    # Модель одного списка задач (или сводного вида). Строка модели списка = индекс задачи в хранилище
+    # (task_update/task_delete по index), tasks - тот же список TaskRecord, что и в TasksPanel.task_lists.
+    # Шрифт и цвет не хранятся в элементах: модель отдаёт общий словарь стилей панели.
+    # owners задаётся у сводных видов: тогда к тексту дописывается имя списка задачи.
+    TaskRole = Qt.ItemDataRole.UserRole
+    ROW_SIZE = QSize(0, 32)
+    def __init__(self, name, tasks, styles, loc, parent=None, owners=None):
+        super().__init__(parent)
+        self.name = name; self.tasks = tasks; self.styles = styles; self.loc = loc; self.owners = owners
+        self._rows = None # задача -> строка, строится при первом поиске строки
+
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.tasks)
+
+    def flags(self, index):
+        if not index.isValid(): return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsUserCheckable
+
+    def display_text(self, task):
+        text = f"{'!' * task.priority} {task.text}" if task.priority else task.text
+        if task.due: text = f"{text}  [{task.due}]"
+        if self.owners is not None: text = f"{text}  · {self.owners.get(task, '')}"
+        return text
+
+    def tooltip(self, task):
+        lines = [task.text]
+        if task.due: lines.append(self.loc.get("task_due_tooltip").format(due=task.due))
+        if task.created: lines.append(self.loc.get("task_created_tooltip").format(time=task.created))
+        if task.completed_at: lines.append(self.loc.get("task_completed_tooltip").format(time=task.completed_at))
+        return "\n".join(lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.tasks): return None
+        task = self.tasks[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole: return self.display_text(task)
+        if role == Qt.ItemDataRole.CheckStateRole: return Qt.CheckState.Checked if task.completed else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.FontRole: return self.styles[task.completed][0]
+        if role == Qt.ItemDataRole.ForegroundRole: return self.styles[task.completed][1]
+        if role == Qt.ItemDataRole.SizeHintRole: return self.ROW_SIZE
+        if role == Qt.ItemDataRole.ToolTipRole: return self.tooltip(task)
+        if role == self.TaskRole: return task
+        return None
+
+    def append(self, task):
+        row = len(self.tasks)
+        self.beginInsertRows(QModelIndex(), row, row); self.tasks.append(task); self.endInsertRows()
+        if self._rows is not None: self._rows[task] = row
+        return row
+
+    def remove(self, row):
+        if not 0 <= row < len(self.tasks): return False
+        self.beginRemoveRows(QModelIndex(), row, row); del self.tasks[row]; self.endRemoveRows()
+        self._rows = None # последующие строки сдвинулись; удаление и так O(n) из-за del
+        return True
+
+    def row_of(self, task):
+        # Строка задачи в списке за O(1): отметка, правка и удаление из сводного вида не обходят список
+        if self._rows is None: self._rows = {t: row for row, t in enumerate(self.tasks)}
+        return self._rows.get(task, -1)
+
+    def task_changed(self, row):
+        index = self.index(row); self.dataChanged.emit(index, index)
+
+    def set_styles(self, styles):
+        if styles is self.styles: return
+        self.styles = styles
+        if self.tasks: self.dataChanged.emit(self.index(0), self.index(len(self.tasks) - 1), [Qt.ItemDataRole.FontRole, Qt.ItemDataRole.ForegroundRole])
+
+
+
+class TaskFilterProxyModel(QSortFilterProxyModel):
+    # "Скрыть выполненные" (и пустые задачи) и сортировка по сроку/приоритету поверх модели текущего списка.
+    # Порядок в хранилище не меняется: "manual" просто отключает сортировку прокси.
+    SORT_KEYS = {
+        "due": lambda task, row: (not task.due, task.due, -task.priority, row),
+        "priority": lambda task, row: (-task.priority, not task.due, task.due, row),
+    }
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.hide_completed = False; self.sort_mode = "manual"
+
+    def set_hide_completed(self, hide):
+        if hide == self.hide_completed: return
+        self.hide_completed = hide
+        self.invalidateFilter()
+
+    def set_sort_mode(self, mode):
+        if mode == self.sort_mode: return
+        self.sort_mode = mode
+        self.sort(-1 if mode == "manual" else 0)
+        self.invalidate() # sort() с тем же столбцом ничего не делает, а ключ сортировки сменился
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        task = self.sourceModel().tasks[source_row]
+        return bool(task.text) and not (self.hide_completed and task.completed)
+
+    def lessThan(self, left, right):
+        tasks = self.sourceModel().tasks; key = self.SORT_KEYS[self.sort_mode]
+        return key(tasks[left.row()], left.row()) < key(tasks[right.row()], right.row())
+
+
 class TasksPanel(QWidget):
+    VIEWS = ("today", "overdue", "open") # сводные виды по всем спискам, строятся из TaskIndex
+    SORT_MODES = ("manual", "due", "priority")
     def __init__(self, data_manager):
         super().__init__()
         self.data_manager = data_manager
         self.loc = data_manager.loc_manager
-        self.task_lists = {}
+        self.task_lists = {} # имя -> [TaskRecord]
+        self.task_models = {} # имя -> TaskListModel, создаются при первом открытии списка
+        self.task_index = TaskIndex()
         self.current_list_name = ""
+        self.current_view = None; self.view_model = None # открытый сводный вид вместо списка
         self.list_names = []
+        self._task_styles_key = None; self._task_styles = {} # completed -> (шрифт, цвет), пересчитывается при смене темы
+        self.empty_model = TaskListModel("", [], self._task_styles, self.loc, self)
 
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
@@ -237,126 +1742,201 @@ class TasksPanel(QWidget):
         self.hide_completed_checkbox.stateChanged.connect(self.filter_tasks)
         list_mgmt_layout.addWidget(self.prev_list_btn); list_mgmt_layout.addWidget(self.list_name_label, 1); list_mgmt_layout.addWidget(self.next_list_btn); list_mgmt_layout.addStretch(); list_mgmt_layout.addWidget(self.hide_completed_checkbox)
 
-        self.task_list_widget = QListWidget()
-        self.task_list_widget.setObjectName("TaskList") # Уникальное имя для стилизации
-        self.task_list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.task_list_widget.customContextMenuRequested.connect(self.show_task_context_menu)
-        self.task_list_widget.itemDoubleClicked.connect(self.edit_task)
-        self.task_list_widget.itemClicked.connect(self.toggle_task_completion) # Клик по элементу для отметки
+        self.task_proxy = TaskFilterProxyModel(self); self.task_proxy.setSourceModel(self.empty_model)
+        self.task_list_view = QListView()
+        self.task_list_view.setObjectName("TaskList") # Уникальное имя для стилизации
+        self.task_list_view.setUniformItemSizes(True)
+        self.task_list_view.setModel(self.task_proxy)
+        self.task_list_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.task_list_view.customContextMenuRequested.connect(self.show_task_context_menu)
+        self.task_list_view.doubleClicked.connect(self.edit_task)
+        self.task_list_view.clicked.connect(self.toggle_task_completion) # Клик по элементу для отметки
 
         layout.addLayout(add_task_layout)
         layout.addLayout(list_mgmt_layout)
-        layout.addWidget(self.task_list_widget)
+        layout.addWidget(self.task_list_view)
 
     def retranslate_ui(self):
         self.add_button.setText(self.loc.get("add_task_button"))
         self.task_input.setPlaceholderText(self.loc.get("new_task_placeholder"))
         self.hide_completed_checkbox.setText(self.loc.get("hide_completed_checkbox"))
         self.list_name_label.setToolTip(self.loc.get("list_management_tooltip", "Клик правой кнопкой для управления списками"))
-    
-    def add_task(self, text, is_completed=False):
-        if not text: return
-        item = QListWidgetItem()
-        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-        item.setData(Qt.ItemDataRole.UserRole, {"text": text, "completed": is_completed})
-        item.setSizeHint(QSize(0, 32))
-        self.update_task_item_style(item)
-        self.task_list_widget.addItem(item)
-        self.filter_tasks()
-
-    def update_task_item_style(self, item):
-        task_data = item.data(Qt.ItemDataRole.UserRole)
-        is_completed = task_data.get("completed", False)
-        font = item.font()
-        font.setStrikeOut(is_completed)
-        #font.setUnderline(is_completed) # Подчеркивание
-        item.setFont(font)
-
+        if self.current_view: self.refresh_view()
+
+    def current_model(self): return self.task_proxy.sourceModel()
+
+    def model_for(self, name):
+        model = self.task_models.get(name)
+        if model is None: model = self.task_models[name] = TaskListModel(name, self.task_lists.setdefault(name, []), self.task_styles(), self.loc, self)
+        return model
+
+    def locate(self, proxy_index):
+        # -> (имя списка, модель списка, строка в списке, задача) или None.
+        # В сводном виде задача ищется в своём списке: индекс в хранилище - это строка модели списка.
+        if not proxy_index.isValid(): return None
+        row = self.task_proxy.mapToSource(proxy_index).row(); tasks = self.current_model().tasks
+        if not 0 <= row < len(tasks): return None
+        task = tasks[row]
+        if self.current_view is None: return self.current_list_name, self.current_model(), row, task
+        name = self.task_index.owner.get(task)
+        if name is None: return None
+        model = self.model_for(name); row = model.row_of(task)
+        return (name, model, row, task) if row >= 0 else None
+
+    def today(self): return datetime.now().strftime(TASK_DUE_FORMAT)
+
+    def add_task(self, task):
+        if not task.text or not self.current_list_name: return
+        self.model_for(self.current_list_name).append(task)
+        self.task_index.add(task, self.current_list_name)
+        self.record_change("task_add", task=task.to_dict())
+        if self.current_view: self.refresh_view()
+
+    def task_styles(self):
+        # Всего два варианта оформления (открытая/выполненная), считаются один раз на тему
         settings = self.data_manager.get_settings()
         is_dark = settings.get("theme") == "dark"
         base_color_hex = settings.get("dark_theme_list_text") if is_dark else settings.get("light_theme_list_text")
-        final_color = QColor(base_color_hex)
-
-        if is_completed:
-            final_color.setAlpha(120)
-
-        item.setForeground(final_color)
-        item.setText(task_data.get("text", ""))
-        item.setCheckState(Qt.CheckState.Checked if is_completed else Qt.CheckState.Unchecked)
+        if base_color_hex != self._task_styles_key:
+            self._task_styles = {}
+            for is_completed in (False, True):
+                font = QFont(); font.setStrikeOut(is_completed)
+                #font.setUnderline(is_completed) # Подчеркивание
+                color = QColor(base_color_hex)
+                if is_completed: color.setAlpha(120)
+                self._task_styles[is_completed] = (font, color)
+            self._task_styles_key = base_color_hex
+        return self._task_styles
+
+    def restyle_tasks(self):
+        styles = self.task_styles()
+        for model in self.task_models.values(): model.set_styles(styles)
+        if self.view_model is not None: self.view_model.set_styles(styles)
 
     def filter_tasks(self, state=None):
-        hide = self.hide_completed_checkbox.isChecked()
-        for i in range(self.task_list_widget.count()):
-            item = self.task_list_widget.item(i)
-            task_data = item.data(Qt.ItemDataRole.UserRole)
-            if task_data: item.setHidden(hide and task_data.get("completed", False))
+        self.task_proxy.set_hide_completed(self.hide_completed_checkbox.isChecked())
             
     def add_task_from_input(self):
         task_text = self.task_input.text().strip()
         if task_text:
-            self.add_task(task_text)
+            # В виде "Сегодня" новая задача сразу получает сегодняшний срок, иначе она бы из него пропала
+            self.add_task(TaskRecord(task_text, created=note_now(), due=self.today() if self.current_view == "today" else ""))
             self.task_input.clear()
-            self.data_manager.save_app_data()
 
     def show_task_context_menu(self, pos):
-        item = self.task_list_widget.itemAt(pos)
-        if not item: return
+        index = self.task_list_view.indexAt(pos); located = self.locate(index)
+        if not located: return
+        task = located[3]
 
         menu = QMenu(self)
-        menu.addAction(self.loc.get("task_menu_edit"), lambda: self.edit_task(item))
-        menu.addAction(self.loc.get("task_menu_toggle_completed"), lambda: self.toggle_task_completion(item))
+        menu.addAction(self.loc.get("task_menu_edit"), lambda: self.edit_task(index))
+        menu.addAction(self.loc.get("task_menu_toggle_completed"), lambda: self.toggle_task_completion(index))
+        menu.addAction(self.loc.get("task_menu_due"), lambda: self.edit_task_due(index))
+        priority_menu = menu.addMenu(self.loc.get("task_menu_priority"))
+        for priority in range(4):
+            action = priority_menu.addAction(self.loc.get(f"task_priority_{priority}"), lambda p=priority: self.set_task_priority(index, p))
+            action.setCheckable(True); action.setChecked(task.priority == priority)
         menu.addSeparator()
-        menu.addAction(self.loc.get("delete_task_tooltip"), lambda: self.delete_task(item))
-        menu.exec(self.task_list_widget.mapToGlobal(pos))
+        menu.addAction(self.loc.get("delete_task_tooltip"), lambda: self.delete_task(index))
+        menu.exec(self.task_list_view.mapToGlobal(pos))
+
+    def commit_task(self, located):
+        name, model, row, task = located
+        self.task_index.update(task)
+        model.task_changed(row) # прокси сам скроет строку, если выполненные скрыты
+        self.record_change("task_update", name, index=row, task=task.to_dict())
+        if self.current_view: self.refresh_view()
     
-    def edit_task(self, item):
-        if not item: return
-        task_data = item.data(Qt.ItemDataRole.UserRole)
-        old_text = task_data.get("text", "")
+    def edit_task(self, index):
+        located = self.locate(index)
+        if not located: return
+        task = located[3]; old_text = task.text
         new_text, ok = QInputDialog.getText(self, self.loc.get("task_menu_edit"), self.loc.get("rename_list_prompt"), QLineEdit.EchoMode.Normal, old_text)
         if ok and new_text and new_text.strip() != old_text:
-            task_data["text"] = new_text.strip()
-            item.setData(Qt.ItemDataRole.UserRole, task_data)
-            self.update_task_item_style(item)
-            self.data_manager.save_app_data()
+            task.text = new_text.strip()
+            self.commit_task(located)
     
-    def toggle_task_completion(self, item):
-        if not item: return
-        task_data = item.data(Qt.ItemDataRole.UserRole)
-        task_data["completed"] = not task_data.get("completed", False)
-        item.setData(Qt.ItemDataRole.UserRole, task_data)
-        self.update_task_item_style(item)
-        self.filter_tasks()
-        self.data_manager.save_app_data()
-
-    def delete_task(self, item):
-        row = self.task_list_widget.row(item)
-        if row >= 0:
-            self.task_list_widget.takeItem(row)
-            self.data_manager.save_app_data()
-
-    def get_task_lists_data(self):
-        if self.current_list_name and self.current_list_name in self.task_lists:
-            self.task_lists[self.current_list_name] = [self.task_list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.task_list_widget.count())]
-        return self.task_lists
+    def toggle_task_completion(self, index):
+        located = self.locate(index)
+        if not located: return
+        located[3].set_completed(not located[3].completed)
+        self.commit_task(located)
+
+    def edit_task_due(self, index):
+        located = self.locate(index)
+        if not located: return
+        task = located[3]
+        value, ok = QInputDialog.getText(self, self.loc.get("task_menu_due"), self.loc.get("task_due_prompt"), QLineEdit.EchoMode.Normal, task.due or self.today())
+        if not ok: return
+        value = value.strip()
+        if value:
+            try: value = datetime.strptime(value, TASK_DUE_FORMAT).strftime(TASK_DUE_FORMAT)
+            except ValueError: QMessageBox.warning(self, self.loc.get("task_menu_due"), self.loc.get("task_due_invalid").format(value=value)); return
+        if value != task.due:
+            task.due = value
+            self.commit_task(located)
+
+    def set_task_priority(self, index, priority):
+        located = self.locate(index)
+        if located and located[3].priority != priority:
+            located[3].priority = priority
+            self.commit_task(located)
+
+    def delete_task(self, index):
+        located = self.locate(index)
+        if not located: return
+        name, model, row, task = located
+        if model.remove(row):
+            self.task_index.remove(task)
+            self.record_change("task_delete", name, index=row)
+            if self.current_view: self.refresh_view()
+
+    def record_change(self, op, list_name=None, **fields):
+        self.data_manager.save_app_data({"op": op, "list": self.current_list_name if list_name is None else list_name, **fields})
 
     def load_task_lists(self, task_lists_data, active_list_name):
-        self.task_lists = task_lists_data if task_lists_data else {"Default": []}
+        # Записи задач и индексы строятся сразу для всех списков (нужны сводным видам), модели - лениво
+        old_models = list(self.task_models.values())
+        self.task_lists = {name: [TaskRecord.from_dict(t) for t in tasks] for name, tasks in (task_lists_data or {"Default": []}).items()}
+        self.task_models = {}; self.task_index = TaskIndex()
+        for name, tasks in self.task_lists.items(): self.task_index.add_list(name, tasks)
         self.list_names = sorted(self.task_lists.keys())
         self.current_list_name = active_list_name if active_list_name in self.list_names else (self.list_names[0] if self.list_names else "")
-        self._load_current_list_display()
+        if self.current_view: self.refresh_view()
+        else: self._load_current_list_display()
+        for model in old_models: model.deleteLater()
+
+    def _set_source_model(self, model):
+        if self.task_proxy.sourceModel() is not model: self.task_proxy.setSourceModel(model)
 
     def _load_current_list_display(self):
-        self.task_list_widget.clear()
-        if not self.current_list_name: return
-        self.list_name_label.setText(f"<b>{self.current_list_name}</b>")
-        tasks = self.task_lists.get(self.current_list_name, [])
-        for t in tasks: self.add_task(t['text'], t['completed'])
-        self.filter_tasks()
+        # Смена списка = смена модели у прокси; элементы не пересоздаются, строки рисуются только видимые
+        self.current_view = None
+        self.list_name_label.setText(f"<b>{self.current_list_name}</b>" if self.current_list_name else "")
+        self._set_source_model(self.model_for(self.current_list_name) if self.current_list_name else self.empty_model)
+        if self.view_model is not None: self.view_model.deleteLater(); self.view_model = None
+
+    def view_tasks(self, view):
+        if view == "today": return self.task_index.due_on(self.today())
+        if view == "overdue": return self.task_index.overdue(self.today())
+        return self.task_index.all_open()
+
+    def show_view(self, view):
+        self.current_view = view
+        self.refresh_view()
+
+    def refresh_view(self):
+        # Вид пересобирается из индексов после каждого изменения: это срез, а не проход по всем спискам
+        title = self.loc.get(f"task_view_{self.current_view}")
+        model = TaskListModel(title, self.view_tasks(self.current_view), self.task_styles(), self.loc, self, owners=self.task_index.owner)
+        self.list_name_label.setText(f"<b>{title}</b> ({len(model.tasks)})")
+        old_model = self.view_model; self.view_model = model
+        self._set_source_model(model)
+        if old_model is not None: old_model.deleteLater()
 
     def switch_list(self, direction):
+        if self.current_view: self._load_current_list_display(); return # из сводного вида стрелки возвращают к спискам
         if not self.list_names or len(self.list_names) < 2: return
-        if self.current_list_name: self.task_lists[self.current_list_name] = [self.task_list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.task_list_widget.count())]
         current_index = self.list_names.index(self.current_list_name)
         new_index = (current_index + direction) % len(self.list_names)
         self.current_list_name = self.list_names[new_index]
@@ -366,26 +1946,37 @@ class TasksPanel(QWidget):
     def show_list_context_menu(self, pos):
         menu = QMenu(self)
         menu.addAction(self.loc.get("add_list_menu"), self.add_new_list)
-        if self.current_list_name: menu.addAction(self.loc.get("rename_list_menu"), self.rename_current_list)
-        if len(self.list_names) > 1: menu.addAction(self.loc.get("delete_list_menu"), self.delete_current_list)
+        if self.current_list_name and not self.current_view: menu.addAction(self.loc.get("rename_list_menu"), self.rename_current_list)
+        if len(self.list_names) > 1 and not self.current_view: menu.addAction(self.loc.get("delete_list_menu"), self.delete_current_list)
+        menu.addSeparator()
+        for view in self.VIEWS:
+            action = menu.addAction(self.loc.get(f"task_view_{view}"), lambda v=view: self.show_view(v))
+            action.setCheckable(True); action.setChecked(self.current_view == view)
+        sort_menu = menu.addMenu(self.loc.get("task_sort_menu"))
+        for mode in self.SORT_MODES:
+            action = sort_menu.addAction(self.loc.get(f"task_sort_{mode}"), lambda m=mode: self.task_proxy.set_sort_mode(m))
+            action.setCheckable(True); action.setChecked(self.task_proxy.sort_mode == mode)
         menu.exec(self.list_name_label.mapToGlobal(pos))
     
     def add_new_list(self):
         text, ok = QInputDialog.getText(self, self.loc.get("add_list_menu"), self.loc.get("new_list_prompt"))
         if ok and text and text not in self.task_lists:
-            if self.current_list_name: self.task_lists[self.current_list_name] = [self.task_list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.task_list_widget.count())]
             self.task_lists[text] = []
             self.list_names = sorted(self.task_lists.keys())
             self.current_list_name = text
             self._load_current_list_display()
+            self.record_change("list_add")
             self.data_manager.save_app_data()
 
     def rename_current_list(self):
         text, ok = QInputDialog.getText(self, self.loc.get("rename_list_menu"), self.loc.get("rename_list_prompt"), QLineEdit.EchoMode.Normal, self.current_list_name)
         if ok and text and text != self.current_list_name and text not in self.task_lists:
-            self.task_lists[text] = [self.task_list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.task_list_widget.count())]
-            del self.task_lists[self.current_list_name]
+            tasks = self.task_lists[text] = self.task_lists.pop(self.current_list_name)
+            self.task_index.rename_list(tasks, text)
+            model = self.task_models.pop(self.current_list_name, None)
+            if model is not None: model.name = text; self.task_models[text] = model
             self.list_names = sorted(self.task_lists.keys())
+            self.record_change("list_rename", new_name=text)
             self.current_list_name = text
             self.list_name_label.setText(f"<b>{self.current_list_name}</b>")
             self.data_manager.save_app_data()
@@ -395,14 +1986,134 @@ class TasksPanel(QWidget):
         reply = QMessageBox.question(self, self.loc.get("delete_list_menu"), self.loc.get("delete_list_confirm").format(list_name=self.current_list_name))
         if reply == QMessageBox.StandardButton.Yes:
             current_index = self.list_names.index(self.current_list_name)
-            del self.task_lists[self.current_list_name]
+            self.task_index.remove_list(self.task_lists.pop(self.current_list_name))
+            model = self.task_models.pop(self.current_list_name, None)
+            self.record_change("list_delete")
             self.list_names = sorted(self.task_lists.keys())
             new_index = max(0, current_index - 1) if current_index > 0 else 0
             self.current_list_name = self.list_names[new_index] if self.list_names else ""
             self._load_current_list_display()
+            if model is not None: model.deleteLater()
             self.data_manager.save_app_data()
 
 
+class NotesListModel(QAbstractListModel):
+    # keys упорядочены по возрастанию (created, id), строка 0 - последний элемент: новая заметка
+    # добавляется в конец списка, а строка по id находится бинарным поиском.
+    # При фильтре keys - только совпадения (matches), весь архив с его постраничной загрузкой
+    # ждёт в all_keys/all_loaded_count, поэтому фильтр стоит O(число совпадений), а не O(число заметок).
+    KeyRole = Qt.ItemDataRole.UserRole
+    PAGE_SIZE = 200
+    def __init__(self, storage, parent=None):
+        super().__init__(parent)
+        self.storage = storage; self.keys = self.all_keys = []; self.loaded_count = self.all_loaded_count = 0; self.matches = None
+
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else self.loaded_count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self.loaded_count: return None
+        key = self.key_at(index.row())
+        if role == self.KeyRole: return key
+        if role == Qt.ItemDataRole.DisplayRole:
+            note = self.storage.get_note(key)
+            return note.get("created", "") if note else None
+        if role == Qt.ItemDataRole.ToolTipRole:
+            note = self.storage.get_note(key)
+            return note.get("text", "")[:200].split("\n", 1)[0] if note else None
+        if role == Qt.ItemDataRole.SizeHintRole: return QSize(0, 32)
+        return None
+
+    def canFetchMore(self, parent): return not parent.isValid() and self.loaded_count < len(self.keys)
+
+    def fetchMore(self, parent):
+        if parent.isValid(): return
+        self.fetch_until(self.loaded_count + self.PAGE_SIZE - 1)
+
+    def fetch_until(self, row):
+        row = min(row, len(self.keys) - 1)
+        if row < self.loaded_count: return
+        self.beginInsertRows(QModelIndex(), self.loaded_count, row)
+        self.loaded_count = row + 1
+        self.endInsertRows()
+
+    def key_at(self, row): return self.keys[len(self.keys) - 1 - row]
+
+    def sort_key(self, key):
+        note = self.storage.get_note(key)
+        return (note.get("created", "") if note else "", key)
+
+    def set_keys(self, keys):
+        self.beginResetModel()
+        self.keys = self.all_keys = sorted(keys, key=self.sort_key); self.matches = None
+        self.loaded_count = min(self.PAGE_SIZE, len(self.keys))
+        self.endResetModel()
+
+    def set_matches(self, keys):
+        # None - снова весь архив с прежней подгрузкой страниц; иначе только совпадения, первая страница
+        if keys is None and self.matches is None: return
+        self.beginResetModel()
+        if keys is None: self.keys, self.loaded_count, self.matches = self.all_keys, self.all_loaded_count, None
+        else:
+            if self.matches is None: self.all_loaded_count = self.loaded_count
+            self.matches = {key for key in keys if self.storage.get_note(key) is not None}
+            self.keys = sorted(self.matches, key=self.sort_key); self.loaded_count = min(self.PAGE_SIZE, len(self.keys))
+        self.endResetModel()
+
+    def add_keys(self, keys):
+        # Пачка новых ключей: одна перестройка модели вместо вставки по одной строке.
+        # При фильтре пополняется только архив - совпадения пересчитывает панель
+        if self.matches is not None:
+            self.all_keys = sorted(self.all_keys + list(keys), key=self.sort_key)
+            self.all_loaded_count = max(self.all_loaded_count, min(self.PAGE_SIZE, len(self.all_keys))); return
+        self.beginResetModel()
+        self.keys = self.all_keys = sorted(self.keys + list(keys), key=self.sort_key); self.loaded_count = max(self.loaded_count, min(self.PAGE_SIZE, len(self.keys)))
+        self.endResetModel()
+
+    def insert_key(self, key):
+        # Новая заметка видна и при активном фильтре
+        if self.matches is not None:
+            pos = bisect.bisect_left(self.all_keys, self.sort_key(key), key=self.sort_key)
+            if len(self.all_keys) - pos <= self.all_loaded_count: self.all_loaded_count += 1
+            self.all_keys.insert(pos, key); self.matches.add(key)
+        pos = bisect.bisect_left(self.keys, self.sort_key(key), key=self.sort_key); row = len(self.keys) - pos
+        if row > self.loaded_count: self.keys.insert(pos, key); return # ещё не подгруженная страница
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.keys.insert(pos, key); self.loaded_count += 1
+        self.endInsertRows()
+
+    def remove_key(self, key):
+        if self.matches is not None:
+            pos = self._position(self.all_keys, key)
+            if pos >= 0:
+                if len(self.all_keys) - 1 - pos < self.all_loaded_count: self.all_loaded_count -= 1
+                del self.all_keys[pos]
+            self.matches.discard(key)
+        row = self.row_of(key)
+        if row < 0: return
+        pos = len(self.keys) - 1 - row
+        if row < self.loaded_count:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.keys[pos]; self.loaded_count -= 1
+            self.endRemoveRows()
+        else: del self.keys[pos]
+
+    def key_changed(self, key):
+        row = self.row_of(key)
+        if 0 <= row < self.loaded_count: self.dataChanged.emit(self.index(row), self.index(row))
+
+    def _position(self, keys, key):
+        # Ключ сортировки берётся из заметки, поэтому заметка должна ещё быть в хранилище
+        if key is None or self.storage.get_note(key) is None: return -1
+        pos = bisect.bisect_left(keys, self.sort_key(key), key=self.sort_key)
+        return pos if pos < len(keys) and keys[pos] == key else -1
+
+    def contains(self, key): return self._position(self.all_keys, key) >= 0
+
+    def row_of(self, key):
+        pos = self._position(self.keys, key)
+        return len(self.keys) - 1 - pos if pos >= 0 else -1
+
+
 class NotesPanel(QWidget):
     # ... (код остается почти без изменений) ...
     zen_mode_requested = pyqtSignal(str, str)
@@ -410,10 +2121,10 @@ class NotesPanel(QWidget):
         super().__init__()
         self.data_manager = data_manager
         self.loc = data_manager.loc_manager
-        self.current_note_item = None
-        self.saved_text = ""
-        self.is_dirty = False
-        self.all_tags = set()
+        self.current_note_key = None
+        self.tag_index = TagIndex()
+        self.sorted_tags = [] # совпадает с элементами tag_filter_combo после "Все теги"
+        self._syncing_selection = False
         
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 5, 0, 0)
@@ -422,6 +2133,11 @@ class NotesPanel(QWidget):
         self.notes_editor_label = QLabel()
         self.notes_editor = NoteEditor()
         self.notes_editor.textChanged.connect(self.on_editor_text_changed)
+        self.notes_editor.document().modificationChanged.connect(self.schedule_status_update)
+        # Статус перерисовывается не чаще раза в 200 мс, а не на каждое нажатие клавиши
+        self.status_timer = QTimer(self); self.status_timer.setSingleShot(True); self.status_timer.setInterval(200)
+        self.status_timer.timeout.connect(self.data_manager.main_popup_on_data_changed)
+        self.autosave_timer = QTimer(self); self.autosave_timer.setSingleShot(True); self.autosave_timer.timeout.connect(self.save_if_dirty)
         self.notes_editor.save_and_new_requested.connect(self.handle_save_and_new)
 
         button_layout = QHBoxLayout()
@@ -448,16 +2164,19 @@ class NotesPanel(QWidget):
         filter_layout.addWidget(self.search_input, 1)
         filter_layout.addWidget(self.tag_filter_combo)
 
-        self.note_list_widget = QListWidget()
-        self.note_list_widget.currentItemChanged.connect(self.display_selected_note)
-        self.note_list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.note_list_widget.customContextMenuRequested.connect(self.show_note_context_menu)
+        self.notes_model = NotesListModel(data_manager.storage, self)
+        self.note_list_view = QListView()
+        self.note_list_view.setUniformItemSizes(True)
+        self.note_list_view.setModel(self.notes_model)
+        self.note_list_view.selectionModel().currentChanged.connect(self.display_selected_note)
+        self.note_list_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.note_list_view.customContextMenuRequested.connect(self.show_note_context_menu)
 
         layout.addWidget(self.notes_editor_label)
         layout.addWidget(self.notes_editor, 1)
         layout.addLayout(button_layout)
         layout.addLayout(filter_layout)
-        layout.addWidget(self.note_list_widget, 1)
+        layout.addWidget(self.note_list_view, 1)
 
     def retranslate_ui(self):
         self.notes_editor_label.setText(self.loc.get("notes_editor_label"))
@@ -467,120 +2186,281 @@ class NotesPanel(QWidget):
         self.search_input.setPlaceholderText(self.loc.get("search_placeholder"))
         self.notes_editor.setPlaceholderText(self.loc.get("new_note_placeholder"))
         
-        current_text = self.tag_filter_combo.currentText()
-        all_tags_text = self.loc.get("all_tags_combo")
+        if self.tag_filter_combo.count() == 0: self.tag_filter_combo.addItem("")
+        self.tag_filter_combo.setItemText(0, self.loc.get("all_tags_combo"))
 
+    def rebuild_tag_combo(self):
+        current_tag = self.selected_tag()
+        self.sorted_tags = sorted(self.tag_index.tags())
         self.tag_filter_combo.blockSignals(True)
         self.tag_filter_combo.clear()
-        self.tag_filter_combo.addItem(all_tags_text)
-        self.tag_filter_combo.addItems(sorted(list(self.all_tags)))
-        
-        idx = self.tag_filter_combo.findText(current_text)
-        if idx != -1: self.tag_filter_combo.setCurrentIndex(idx)
-        else: self.tag_filter_combo.setCurrentIndex(0)
-             
+        self.tag_filter_combo.addItem(self.loc.get("all_tags_combo"))
+        self.tag_filter_combo.addItems(self.sorted_tags)
+        idx = self.tag_filter_combo.findText(current_tag) if current_tag else -1
+        self.tag_filter_combo.setCurrentIndex(max(idx, 0))
         self.tag_filter_combo.blockSignals(False)
         self.filter_notes()
 
+    def update_tag_combo(self, added, removed):
+        # Точечные вставки/удаления вместо полной перестройки списка тегов
+        self.tag_filter_combo.blockSignals(True)
+        for tag in added:
+            pos = bisect.bisect_left(self.sorted_tags, tag)
+            self.sorted_tags.insert(pos, tag); self.tag_filter_combo.insertItem(pos + 1, tag)
+        selection_lost = False
+        for tag in removed:
+            pos = bisect.bisect_left(self.sorted_tags, tag)
+            if pos < len(self.sorted_tags) and self.sorted_tags[pos] == tag:
+                selection_lost |= self.tag_filter_combo.currentIndex() == pos + 1
+                del self.sorted_tags[pos]; self.tag_filter_combo.removeItem(pos + 1)
+        if selection_lost: self.tag_filter_combo.setCurrentIndex(0)
+        self.tag_filter_combo.blockSignals(False)
+        if selection_lost: self.filter_notes()
+
+    def set_note_tags(self, key, text):
+        added, removed = self.tag_index.set_note_tags(key, self.find_tags(text))
+        if added or removed: self.update_tag_combo(added, removed)
+
+    def selected_tag(self):
+        return self.tag_filter_combo.currentText() if self.tag_filter_combo.currentIndex() > 0 else None
+
     def show_note_context_menu(self, pos):
-        item = self.note_list_widget.itemAt(pos)
-        if not item: return
+        index = self.note_list_view.indexAt(pos)
+        if not index.isValid(): return
+        key = index.data(NotesListModel.KeyRole)
 
         menu = QMenu(self)
+        history_action = QAction(self.loc.get("note_history_menu"), self)
+        history_action.triggered.connect(lambda: self.show_note_history(key))
+        menu.addAction(history_action)
         delete_action = QAction(self.loc.get("delete_note_tooltip"), self)
-        delete_action.triggered.connect(lambda: self.perform_delete_note(item))
+        delete_action.triggered.connect(lambda: self.perform_delete_note(key))
         menu.addAction(delete_action)
-        menu.exec(self.note_list_widget.mapToGlobal(pos))
+        menu.exec(self.note_list_view.mapToGlobal(pos))
     
-    def find_tags(self, text): return set(re.findall(r'#(\w+)', text))
+    def show_note_history(self, key):
+        if key == self.current_note_key and self.is_dirty: self.save_current_note()
+        dialog = NoteHistoryDialog(self.data_manager.note_history, key, self.loc, self)
+        if dialog.exec() and dialog.selected_text is not None: self.restore_note_text(key, dialog.selected_text)
+
+    def restore_note_text(self, key, text):
+        storage = self.data_manager.storage; previous = storage.get_note(key)
+        try: key, changed = storage.save_note_text(key, text)
+        except Exception as e: print(f"Ошибка сохранения данных: {e}"); return
+        if not changed: return
+        self.data_manager.note_history.record(storage.get_note(key), previous)
+        self.refresh_note(key); self.data_manager.main_popup_on_data_changed()
+
+    def find_tags(self, text): return find_tags(text)
     
-    def update_tag_filter(self): self.retranslate_ui()
-
     def filter_notes(self):
-        search_text = self.search_input.text().lower(); selected_tag_item_text = self.tag_filter_combo.currentText()
-        is_all_tags_selected = selected_tag_item_text == self.loc.get("all_tags_combo")
-        for i in range(self.note_list_widget.count()):
-            item = self.note_list_widget.item(i); note_data = item.data(Qt.ItemDataRole.UserRole); note_text = note_data.get('text', ''); note_timestamp = note_data.get('timestamp', ''); text_match = search_text in (note_timestamp + ' ' + note_text).lower(); tag_match = is_all_tags_selected or (f"#{selected_tag_item_text}" in note_text); item.setHidden(not (text_match and tag_match))
+        selected_tag = self.selected_tag()
+        query = self.search_input.text()
+        if not query and selected_tag is None: self.apply_matches(None); return
+        matches = self.data_manager.storage.get_search_index().search(query) if query else None
+        if selected_tag is not None:
+            tagged = self.tag_index.keys_with(selected_tag)
+            matches = tagged if matches is None else matches & tagged
+        self.apply_matches(matches)
+
+    def apply_matches(self, matches):
+        # Фильтр меняет только список: текущую строку, которую представление сдвинет само, в редактор не пускаем,
+        # открытая заметка остаётся current_note_key и снова выделяется, если видна
+        self._syncing_selection = True
+        try: self.notes_model.set_matches(matches)
+        finally: self._syncing_selection = False
+        if self.current_note_key is not None and self.select_note_key(self.current_note_key, notify=False) is not None: return
+        if self.note_list_view.currentIndex().isValid():
+            self._syncing_selection = True
+            try: self.note_list_view.selectionModel().clear()
+            finally: self._syncing_selection = False
     
-    def display_selected_note(self, current_item, previous_item):
-        if previous_item and self.is_dirty: self.save_current_note()
-        if not current_item:
-            if self.current_note_item is not None: self.clear_for_new_note(force=True)
+    def display_selected_note(self, current, previous):
+        if self._syncing_selection: return
+        key = current.data(NotesListModel.KeyRole) if current.isValid() else None
+        if key is not None and key == self.current_note_key: return # заметка уже открыта (выделение вернулось после фильтра)
+        if self.current_note_key is not None and self.is_dirty: self.save_current_note() # открытая заметка могла быть скрыта фильтром
+        if key is None:
+            if self.current_note_key is not None: self.clear_for_new_note(force=True)
             return
-        self.current_note_item = current_item
-        note_data = self.current_note_item.data(Qt.ItemDataRole.UserRole)
-        source_text = note_data.get("text", ""); self.notes_editor.setPlainText(source_text); self.saved_text = source_text; self.on_editor_text_changed()
+        self.current_note_key = key
+        source_text = self.data_manager.storage.get_note(key).get("text", ""); self.notes_editor.setPlainText(source_text); self.mark_clean()
     
     def save_current_note(self):
         text = self.notes_editor.toPlainText().strip()
-        if not self.current_note_item and not text: return
-        new_tags = self.find_tags(text)
-        if new_tags != self.all_tags:
-            self.all_tags.update(new_tags)
-            self.update_tag_filter()
-        if self.current_note_item:
-            note_data = self.current_note_item.data(Qt.ItemDataRole.UserRole); note_data["text"] = text; self.current_note_item.setData(Qt.ItemDataRole.UserRole, note_data)
-        else:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S"); note_data = {"timestamp": timestamp, "text": text}; new_item = self.add_note_item(note_data); self.current_note_item = new_item; self.note_list_widget.blockSignals(True); self.note_list_widget.setCurrentItem(new_item); self.note_list_widget.blockSignals(False)
-        self.saved_text = text; self.on_editor_text_changed(); self.data_manager.save_app_data()
+        if self.current_note_key is None and not text: return
+        existing = self.data_manager.storage.get_note(self.current_note_key) if self.current_note_key else None
+        is_new = existing is None
+        if is_new: note_data = new_note(text); self.current_note_key = note_data["id"]
+        else: note_data = dict(existing, text=text, modified=note_now())
+        self.mark_clean()
+        self.set_note_tags(self.current_note_key, text)
+        self.data_manager.save_app_data({"op": "note_upsert", "note": note_data})
+        self.data_manager.note_history.record(note_data, existing)
+        if is_new:
+            self.notes_model.insert_key(self.current_note_key)
+            self.select_note_key(self.current_note_key, notify=False)
+        else: self.notes_model.key_changed(self.current_note_key)
     
     def load_notes(self, notes_data):
-        self.note_list_widget.clear(); self.all_tags.clear()
-        sorted_notes = sorted(notes_data, key=lambda x: x.get('timestamp', ''), reverse=True)
-        for note in sorted_notes:
-            self.add_note_item(note); self.all_tags.update(self.find_tags(note.get("text", "")))
-        self.update_tag_filter(); self.clear_for_new_note(force=True)
+        self.tag_index.clear()
+        keys = [note["id"] for note in notes_data]
+        for note in notes_data: self.tag_index.set_note_tags(note["id"], self.find_tags(note.get("text", "")))
+        self.notes_model.set_keys(keys)
+        self.rebuild_tag_combo(); self.clear_for_new_note(force=True)
     
     def open_zen_mode(self):
-        self.save_if_dirty(); text = self.notes_editor.toPlainText(); timestamp = ""
-        if self.current_note_item: timestamp = self.current_note_item.data(Qt.ItemDataRole.UserRole)['timestamp']
-        self.zen_mode_requested.emit(text, timestamp)
+        self.save_if_dirty(); text = self.notes_editor.toPlainText()
+        self.zen_mode_requested.emit(text, self.current_note_key or "")
+
+    def select_note_key(self, key, notify=True):
+        row = self.notes_model.row_of(key)
+        if row < 0: return None
+        self.notes_model.fetch_until(row)
+        index = self.notes_model.index(row)
+        self._syncing_selection = not notify
+        try: self.note_list_view.setCurrentIndex(index)
+        finally: self._syncing_selection = False
+        return index
     
-    def find_and_select_note_by_timestamp(self, timestamp):
-        if not timestamp: return
-        for i in range(self.note_list_widget.count()):
-            item = self.note_list_widget.item(i); note_data = item.data(Qt.ItemDataRole.UserRole)
-            if note_data and note_data.get('timestamp') == timestamp:
-                self.note_list_widget.setCurrentItem(item); self.note_list_widget.scrollToItem(item, QListWidget.ScrollHint.PositionAtCenter); break
+    def find_and_select_note(self, key):
+        if not key: return
+        index = self.select_note_key(key)
+        if index is not None: self.note_list_view.scrollTo(index, QListView.ScrollHint.PositionAtCenter)
     
     def clear_for_new_note(self, force=False):
         if not force and self.is_dirty: self.save_current_note()
-        self.current_note_item = None
-        if self.note_list_widget.currentItem() is not None: self.note_list_widget.blockSignals(True); self.note_list_widget.setCurrentItem(None); self.note_list_widget.blockSignals(False)
-        self.notes_editor.clear(); self.saved_text = ""; self.on_editor_text_changed(); self.notes_editor.setPlaceholderText(self.loc.get("new_note_placeholder"))
+        self.current_note_key = None
+        if self.note_list_view.currentIndex().isValid():
+            self._syncing_selection = True
+            try: self.note_list_view.selectionModel().clear()
+            finally: self._syncing_selection = False
+        self.notes_editor.clear(); self.mark_clean(); self.notes_editor.setPlaceholderText(self.loc.get("new_note_placeholder"))
     
+    def restore_draft(self, key, text):
+        # Несохранённый текст после перечитывания данных: заметка снова открыта, правки остаются несохранёнными.
+        # Если заметку удалили вне приложения, черновик сохранится как новая заметка
+        if key and self.data_manager.storage.get_note(key) is None: key = None
+        self.clear_for_new_note(force=True); self.current_note_key = key
+        if key: self.select_note_key(key, notify=False)
+        self.notes_editor.setPlainText(text); self.notes_editor.document().setModified(True); self.on_editor_text_changed()
+
     def handle_save_and_new(self): self.save_current_note(); self.clear_for_new_note(force=True)
+
+    def add_notes(self, notes):
+        # Пачка уже сохранённых в хранилище заметок (импорт): теги, список и фильтр обновляются один раз
+        added = set()
+        for note in notes: added.update(self.tag_index.set_note_tags(note["id"], self.find_tags(note.get("text", "")))[0])
+        if added: self.update_tag_combo(sorted(added), [])
+        self._syncing_selection = True # сброс модели не должен очищать открытую в редакторе заметку
+        try: self.notes_model.add_keys([note["id"] for note in notes])
+        finally: self._syncing_selection = False
+        if self.current_note_key: self.select_note_key(self.current_note_key, notify=False)
+        if self.notes_model.matches is not None: self.filter_notes()
+
+    def refresh_note(self, key):
+        # Заметка изменена в обход панели (например, в режиме Zen), а панель осталась в памяти
+        note = self.data_manager.storage.get_note(key)
+        if note is None: return
+        if not self.notes_model.contains(key): self.notes_model.insert_key(key)
+        else: self.notes_model.key_changed(key)
+        self.set_note_tags(key, note.get("text", ""))
+        if key == self.current_note_key:
+            self.notes_editor.setPlainText(note.get("text", "")); self.mark_clean()
     
+    @property
+    def is_dirty(self): return self.notes_editor.document().isModified()
+
     def on_editor_text_changed(self):
-        self.is_dirty = (self.notes_editor.toPlainText().strip() != self.saved_text.strip()); self.data_manager.main_popup_on_data_changed()
+        # Грязность ведёт сам QTextDocument, поэтому текст на каждое нажатие не копируется
+        seconds = self.data_manager.get_settings().get("notes_autosave_seconds", 0)
+        if seconds > 0 and self.is_dirty: self.autosave_timer.start(seconds * 1000)
+
+    def schedule_status_update(self, *args):
+        if not self.status_timer.isActive(): self.status_timer.start()
+
+    def mark_clean(self):
+        self.notes_editor.document().setModified(False); self.autosave_timer.stop(); self.schedule_status_update()
     
     def save_if_dirty(self):
         if self.is_dirty: self.save_current_note()
     
-    def add_note_item(self, note_data):
-        list_item = QListWidgetItem()
-        list_item.setText(note_data["timestamp"])
-        list_item.setData(Qt.ItemDataRole.UserRole, note_data)
-        list_item.setSizeHint(QSize(0, 32))
-        self.note_list_widget.insertItem(0, list_item)
-        return list_item
-    
-    def perform_delete_note(self, item_to_delete):
-        if self.note_list_widget.currentItem() == item_to_delete:
+    def perform_delete_note(self, key):
+        if key == self.current_note_key:
             self.clear_for_new_note(force=True)
-        row = self.note_list_widget.row(item_to_delete)
-        if row >= 0:
-            self.note_list_widget.takeItem(row)
-            self.data_manager.save_app_data()
-    
-    def get_notes_data(self): return [self.note_list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.note_list_widget.count())]
-
+        self.notes_model.remove_key(key)
+        removed = self.tag_index.remove_note(key)
+        if removed: self.update_tag_combo([], removed)
+        self.data_manager.save_app_data({"op": "note_delete", "id": key})
+
+
+class DocumentStats(QObject):
+    # Инкрементальный подсчет слов: храним число слов по каждому блоку и пересчитываем только затронутые блоки
+    stats_changed = pyqtSignal()
+    def __init__(self, document, parent=None):
+        super().__init__(parent); self.document = document; self.block_words = []; self.words = 0; self.paragraphs = 0; self.session_start_words = 0
+        self.document.contentsChange.connect(self.on_contents_change); self.recount(); self.start_session()
+    def recount(self):
+        self.block_words = []; block = self.document.begin()
+        while block.isValid(): self.block_words.append(len(block.text().split())); block = block.next()
+        self.words = sum(self.block_words); self.paragraphs = sum(1 for c in self.block_words if c); self.stats_changed.emit()
+    def start_session(self): self.session_start_words = self.words; self.stats_changed.emit()
+    def on_contents_change(self, position, removed, added):
+        doc = self.document; first = doc.findBlock(position); last = doc.findBlock(min(position + added, doc.characterCount() - 1))
+        if not first.isValid() or not last.isValid(): self.recount(); return
+        start = first.blockNumber(); end_old = last.blockNumber() - (doc.blockCount() - len(self.block_words))
+        if end_old < start or end_old >= len(self.block_words): self.recount(); return
+        new_counts = []; block = first
+        while block.isValid():
+            new_counts.append(len(block.text().split()))
+            if block == last: break
+            block = block.next()
+        old_counts = self.block_words[start:end_old + 1]; self.block_words[start:end_old + 1] = new_counts
+        self.words += sum(new_counts) - sum(old_counts); self.paragraphs += sum(1 for c in new_counts if c) - sum(1 for c in old_counts if c)
+        self.stats_changed.emit()
+    def characters(self): return self.document.characterCount() - 1
+    def session_words(self): return self.words - self.session_start_words
+
+class ImageLoader(QThread):
+    # Декодирует фоновые изображения вне GUI-потока. Хранится только последний запрос,
+    # картинка сразу читается в нужном разрешении (setScaledSize), а не в исходном 4K.
+    image_loaded = pyqtSignal(str, QImage)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._request = None; self._cond = threading.Condition(); self._stopping = False
+
+    def request(self, path, target_size):
+        with self._cond:
+            self._request = (path, QSize(target_size)); self._stopping = False
+            self._cond.notify()
+        if not self.isRunning(): self.start()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._request is None and not self._stopping: self._cond.wait()
+                if self._stopping: return
+                path, target = self._request; self._request = None
+            reader = QImageReader(path); reader.setAutoTransform(True); source = reader.size()
+            if source.isValid() and not target.isEmpty():
+                scale = max(target.width() / source.width(), target.height() / source.height())
+                if scale < 1: reader.setScaledSize(QSize(max(1, round(source.width() * scale)), max(1, round(source.height() * scale))))
+            image = reader.read()
+            if image.isNull(): print(f"Ошибка загрузки фона {path}: {reader.errorString()}"); continue
+            self.image_loaded.emit(path, image)
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.wait()
 
 class ZenModeWindow(QWidget):
     # ... (код без изменений)
-    zen_exited = pyqtSignal(str); zen_saved_and_closed = pyqtSignal(str); settings_updated_for_saving = pyqtSignal(dict)
+    zen_exited = pyqtSignal(str); zen_saved_and_closed = pyqtSignal(str); settings_updated_for_saving = pyqtSignal(dict); zen_autosave = pyqtSignal(str)
     def __init__(self, initial_text, settings, loc_manager):
-        super().__init__(); self.settings = settings; self.loc = loc_manager; self.background_pixmap = None; self.player = QMediaPlayer(); self.audio_output = QAudioOutput(); self.player.setAudioOutput(self.audio_output); self.current_playing_button = None; self.playlist_mode = False; self.playlist_files = []; self.playlist_index = 0; self.player.mediaStatusChanged.connect(self.handle_media_status_change); self.pomodoro_timer = QTimer(self); self.pomodoro_timer.timeout.connect(self.update_pomodoro); self.pomodoro_time_left = POMODORO_WORK_TIME; self.is_work_time = True; self.pomodoro_running = False; self.pomodoro_player = QMediaPlayer(); self.pomodoro_audio_output = QAudioOutput(); self.pomodoro_player.setAudioOutput(self.pomodoro_audio_output)
+        # Окно создаётся один раз (TriggerButton.prewarm_zen_window) и переиспользуется через start_session
+        super().__init__(); import_multimedia(); self.exit_emitted = False; self.settings = settings; self.loc = loc_manager; self.background_pixmap = None; self.background_path = None; self.scaled_background = None; self.scaled_background_key = None; self.image_loader = ImageLoader(self); self.image_loader.image_loaded.connect(self.on_background_loaded); self.background_reload_timer = QTimer(self); self.background_reload_timer.setSingleShot(True); self.background_reload_timer.setInterval(200); self.background_reload_timer.timeout.connect(self.request_background); self.player = QMediaPlayer(); self.audio_output = QAudioOutput(); self.player.setAudioOutput(self.audio_output); self.current_playing_button = None; self.playlist_mode = False; self.playlist_files = []; self.playlist_index = 0; self.player.mediaStatusChanged.connect(self.handle_media_status_change); self.pomodoro_timer = QTimer(self); self.pomodoro_timer.timeout.connect(self.update_pomodoro); self.pomodoro_time_left = POMODORO_WORK_TIME; self.is_work_time = True; self.pomodoro_running = False; self.pomodoro_player = QMediaPlayer(); self.pomodoro_audio_output = QAudioOutput(); self.pomodoro_player.setAudioOutput(self.pomodoro_audio_output)
         try:
             script_dir = os.path.dirname(os.path.abspath(__file__)); sound_path = os.path.join(script_dir, "pomodoro_end.wav")
             if os.path.exists(sound_path): self.pomodoro_player.setSource(QUrl.fromLocalFile(sound_path))
@@ -590,27 +2470,42 @@ class ZenModeWindow(QWidget):
         self.editor = QTextEdit()
         self.word_count_label = QLabel("Слов: 0")
         self.audio_panel = self.create_audio_panel()
-        self.settings_panel = SettingsPanel(self.settings, self.loc, self)
+        self.settings_panel = None # создаётся при первом открытии настроек
         
         self.main_layout.addWidget(self.pomodoro_panel)
         self.main_layout.addWidget(self.editor)
         self.main_layout.addWidget(self.word_count_label)
         self.editor.setPlainText(initial_text)
+        self.stats = DocumentStats(self.editor.document(), self)
 
-        self.settings_panel.hide()
-        self.settings_panel.settings_changed.connect(self.update_zen_settings)
         self.loc.language_changed.connect(self.retranslate_ui)
-        self.editor.textChanged.connect(self.update_word_count)
+        self.stats.stats_changed.connect(self.update_word_count)
+        # Автосохранение для восстановления после сбоя: по паузе в наборе и не реже ZEN_AUTOSAVE_MAX_MS
+        self.autosave_revision = self.editor.document().revision()
+        self.autosave_idle_timer = QTimer(self); self.autosave_idle_timer.setSingleShot(True); self.autosave_idle_timer.setInterval(ZEN_AUTOSAVE_IDLE_MS); self.autosave_idle_timer.timeout.connect(self.emit_autosave)
+        self.autosave_max_timer = QTimer(self); self.autosave_max_timer.setSingleShot(True); self.autosave_max_timer.setInterval(ZEN_AUTOSAVE_MAX_MS); self.autosave_max_timer.timeout.connect(self.emit_autosave)
+        self.editor.textChanged.connect(self.schedule_autosave)
         self.retranslate_ui()
 
         self.settings_button = self.create_settings_button(); self.exit_button = self.create_exit_button(); self.editor.setFocus(); self.update_background(); self._update_styles()
     
+    def start_session(self, text, settings):
+        # Вход в Zen для уже созданного окна: только новый текст и, если изменились, настройки
+        self.exit_emitted = False # выход сообщается ровно один раз за сессию
+        changed = changed_settings(self.settings, settings)
+        if changed: self.settings = settings; self._update_styles(changed)
+        # Фон перезапрашивается и тогда, когда прошлая сессия закрылась раньше, чем он успел загрузиться
+        if "zen_bg_path" in changed or self.background_pixmap is None: self.update_background()
+        self.editor.setPlainText(text); self.editor.moveCursor(QTextCursor.MoveOperation.End)
+        self.stats.start_session(); self.autosave_revision = self.editor.document().revision()
+        self.reset_pomodoro(); self.editor.setFocus()
+
     def retranslate_ui(self):
         self.pomodoro_title_label.setText(f"<b>{self.loc.get('pomodoro_label')}</b>")
         self.pomodoro_start_button.setText(self.loc.get('pomodoro_start_btn') if not self.pomodoro_running else self.loc.get('pomodoro_pause_btn'))
         self.pomodoro_reset_button.setText(self.loc.get('pomodoro_reset_btn'))
         self.update_word_count()
-        self.settings_panel.retranslate_ui()
+        if self.settings_panel: self.settings_panel.retranslate_ui()
 
     def create_pomodoro_panel(self):
         panel = QWidget(); layout = QHBoxLayout(panel); layout.setContentsMargins(10, 5, 10, 5)
@@ -643,7 +2538,16 @@ class ZenModeWindow(QWidget):
     def update_pomodoro_label(self):
         mins, secs = divmod(self.pomodoro_time_left, 60); self.pomodoro_label.setText(f"{mins:02d}:{secs:02d}")
     def update_word_count(self):
-        text = self.editor.toPlainText(); word_count = len(text.split()) if text else 0; self.word_count_label.setText(f"{self.loc.get('word_count_label', 'Слов')}: {word_count}")
+        stats = self.stats; session = stats.session_words()
+        self.word_count_label.setText(f"{self.loc.get('word_count_label', 'Слов')}: {stats.words}  |  {self.loc.get('char_count_label', 'Символов')}: {stats.characters()}  |  {self.loc.get('paragraph_count_label', 'Абзацев')}: {stats.paragraphs}  |  {self.loc.get('session_words_label', 'За сессию')}: {session:+d}")
+    def schedule_autosave(self):
+        self.autosave_idle_timer.start()
+        if not self.autosave_max_timer.isActive(): self.autosave_max_timer.start()
+    def emit_autosave(self):
+        self.autosave_idle_timer.stop(); self.autosave_max_timer.stop()
+        revision = self.editor.document().revision()
+        if revision == self.autosave_revision: return
+        self.autosave_revision = revision; self.zen_autosave.emit(self.editor.toPlainText())
     def create_audio_panel(self):
         panel = QWidget(self); panel.setObjectName("audioPanel"); layout = QHBoxLayout(panel); layout.setContentsMargins(10, 5, 10, 5)
         try: script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -693,6 +2597,9 @@ class ZenModeWindow(QWidget):
     def create_exit_button(self): btn = QPushButton("✕", self);  btn.setFixedSize(32, 32); btn.clicked.connect(self.close); return btn; btn.setFixedSize(32, 32); btn.clicked.connect(self.close); return btn
     
     def toggle_settings_panel(self):
+        if self.settings_panel is None:
+            self.settings_panel = SettingsPanel(self.settings, self.loc, self); self.settings_panel.hide()
+            self.settings_panel.settings_changed.connect(self.update_zen_settings)
         if self.settings_panel.isVisible():
             self.settings_panel.hide()
         else:
@@ -701,119 +2608,73 @@ class ZenModeWindow(QWidget):
             self.settings_panel.move((self.width() - self.settings_panel.width()) // 2, (self.height() - self.settings_panel.height()) // 2)
             self.settings_panel.show()
             
-    def _update_styles(self):
-        hp = self.width() * self.settings.get("zen_padding_horiz", 15) // 100; vp = self.height() * self.settings.get("zen_padding_vert", 10) // 100
-        font_family = self.settings.get("zen_font_family", "Georgia"); font_size = self.settings.get("zen_font_size", 18); accent_color = self.settings.get("accent_color", "#007bff")
-        self.main_layout.setContentsMargins(hp, vp, hp, vp)
-        is_dark = self.settings.get("theme", "dark") == "dark"; is_transparent = self.settings.get("zen_editor_transparent", True)
-        
-        editor_bg_str = self.settings.get("dark_theme_bg") if is_dark else self.settings.get("light_theme_bg")
-        editor_bg = QColor(editor_bg_str)
-        if is_transparent: editor_bg.setAlpha(20 if is_dark else 215)
-        
-        default_editor_color = self.settings.get("dark_theme_text") if is_dark else self.settings.get("light_theme_text")
-        editor_color = self.settings.get("zen_font_color") or default_editor_color
-        alignment_str = self.settings.get("zen_alignment", "left")
-        alignment = Qt.AlignmentFlag.AlignJustify if alignment_str == "justify" else Qt.AlignmentFlag.AlignLeft
-        self.editor.setAlignment(alignment)
-        indent = self.settings.get("zen_first_line_indent", 0)
-        
-        editor_bg_rgba = f"rgba({editor_bg.red()}, {editor_bg.green()}, {editor_bg.blue()}, {editor_bg.alphaF()})"
-        
-        scrollbar_handle_color = "rgba(255, 255, 255, 0.2)" if is_dark else "rgba(0, 0, 0, 0.2)"
-        scrollbar_handle_hover_color = "rgba(255, 255, 255, 0.4)" if is_dark else "rgba(0, 0, 0, 0.4)"
-
-        editor_stylesheet = f"""
-            QTextEdit {{
-                background-color: {editor_bg_rgba};
-                border: none;
-                font-family: '{font_family}';
-                font-size: {font_size}pt;
-                color: {editor_color};
-            }}
-            
-            /* Стилизация вертикальной полосы прокрутки */
-            QScrollBar:vertical {{
-                border: none;
-                background: transparent; /* Фон самой полосы делаем прозрачным */
-                width: 8px; /* Ширина */
-                margin: 0px 0px 0px 0px;
-            }}
-            
-            /* Стилизация ползунка */
-            QScrollBar::handle:vertical {{
-                background: {scrollbar_handle_color};
-                border-radius: 4px; /* Скругляем углы */
-                min-height: 25px; /* Минимальная высота ползунка */
-            }}
-            
-            /* Ползунок при наведении */
-            QScrollBar::handle:vertical:hover {{
-                background: {scrollbar_handle_hover_color};
-            }}
-            
-            /* Убираем кнопки со стрелками сверху и снизу */
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{
-                border: none;
-                background: none;
-            }}
-            QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical {{
-                background: none;
-            }}
-        """
-        self.editor.setStyleSheet(editor_stylesheet)
-        
-
-        
+    # Какие ключи настроек затрагивают какую часть окна: при изменении пересчитывается только она
+    ZEN_MARGIN_KEYS = frozenset(("zen_padding_horiz", "zen_padding_vert"))
+    ZEN_EDITOR_KEYS = frozenset(("theme", "light_theme_bg", "dark_theme_bg", "light_theme_text", "dark_theme_text", "zen_editor_transparent", "zen_font_family", "zen_font_size", "zen_font_color"))
+    ZEN_CHROME_KEYS = frozenset(("theme", "accent_color"))
+    ZEN_FILL_KEYS = frozenset(("theme", "light_theme_bg", "dark_theme_bg"))
+
+    def _update_styles(self, changed=None):
+        # changed - изменившиеся ключи настроек; None - применить всё (показ окна)
+        touched = lambda keys: changed is None or not changed.isdisjoint(keys)
+        if touched(self.ZEN_MARGIN_KEYS):
+            hp = self.width() * self.settings.get("zen_padding_horiz", 15) // 100; vp = self.height() * self.settings.get("zen_padding_vert", 10) // 100
+            self.main_layout.setContentsMargins(hp, vp, hp, vp)
+        if touched(self.ZEN_EDITOR_KEYS): self._update_editor_style()
+        if touched(("zen_alignment",)):
+            alignment = Qt.AlignmentFlag.AlignJustify if self.settings.get("zen_alignment", "left") == "justify" else Qt.AlignmentFlag.AlignLeft
+            self.editor.setAlignment(alignment)
+        if touched(("zen_first_line_indent",)): self._update_indent()
+        if touched(self.ZEN_CHROME_KEYS): self._update_chrome_styles()
+        if changed is not None and not changed.isdisjoint(self.ZEN_FILL_KEYS): self.update()
+
+    def _update_editor_style(self): theme_engine.apply(self.editor, "zen_editor", self.settings)
+
+    def _update_indent(self):
+        # Переформатирует все абзацы документа - только при смене отступа или показе окна
         cursor = self.editor.textCursor()
         block_format = cursor.blockFormat()
-        block_format.setTextIndent(indent)
+        block_format.setTextIndent(self.settings.get("zen_first_line_indent", 0))
         cursor.select(QTextCursor.SelectionType.Document)
         cursor.setBlockFormat(block_format)
         cursor.clearSelection()
         self.editor.setTextCursor(cursor)
-        
-        panel_bg = "rgba(0,0,0,0.5)" if is_dark else "rgba(255,255,255,0.6)"; btn_border = "rgba(255,255,255,0.7)" if is_dark else "rgba(0,0,0,0.4)"; btn_bg = "rgba(0,0,0,0.4)" if is_dark else "rgba(255,255,255,0.4)"; btn_color = "white" if is_dark else "black"; btn_hover_bg = "rgba(255,255,255,0.3)" if is_dark else "rgba(0,0,0,0.1)"
-        self.audio_panel.setStyleSheet(f'QWidget#audioPanel {{ background: {panel_bg}; border-radius: 15px; }} QPushButton {{ border: 1px solid {btn_border}; border-radius: 15px; background-color: {btn_bg}; color: {btn_color}; font-size: 11pt; font-weight: bold; }} QPushButton:hover {{ background-color: {btn_hover_bg}; }} QPushButton[playing="true"] {{ background-color: {accent_color}; border-color: #ffffff; color: white; }}')
-        floating_btn_bg = "rgba(30,30,30,0.5)" if is_dark else "rgba(240,240,240,0.7)"
-        floating_btn_color = "#e0e0e0" if is_dark else "#333333" # Светлый крестик для тёмной темы и наоборот
-        
 
-        settings_btn_style = f"background: {floating_btn_bg}; border-radius: 16px;"
-        self.settings_button.setStyleSheet(settings_btn_style)
-
-        exit_btn_style = f"""
-            QPushButton {{
-                background: {floating_btn_bg}; 
-                color: {floating_btn_color};
-                border-radius: 16px;
-                border: none;
-                font-family: 'Arial'; 
-                font-size: 14pt; 
-                font-weight: bold;
-            }}
-            QPushButton:hover {{
-                background-color: #dc3545;
-                color: white;
-            }}
-        """
-        self.exit_button.setStyleSheet(exit_btn_style)
-
-        text_color = '#ccc' if is_dark else '#333'; pomodoro_button_bg = "rgba(255,255,255,0.1)" if is_dark else "rgba(0,0,0,0.05)"; pomodoro_style = f"background-color: transparent; border: none; font-size: 10pt; color: {text_color}; padding: 2px 5px;"
-        self.pomodoro_title_label.setStyleSheet(f"background-color: transparent; color: {text_color}; font-weight:bold;"); self.pomodoro_label.setStyleSheet(f"background-color: transparent; font-size: 14pt; font-weight: bold; color: {text_color};"); self.pomodoro_start_button.setStyleSheet(pomodoro_style + f" QPushButton:hover {{ background-color: {pomodoro_button_bg}; border-radius: 5px; }}"); self.pomodoro_reset_button.setStyleSheet(pomodoro_style + f" QPushButton:hover {{ background-color: {pomodoro_button_bg}; border-radius: 5px; }}"); self.word_count_label.setStyleSheet(f"background-color: transparent; border: none; color: {text_color}; padding: 5px;")
+    def _update_chrome_styles(self):
+        apply = lambda widget, name: theme_engine.apply(widget, name, self.settings)
+        apply(self.audio_panel, "zen_audio_panel"); apply(self.settings_button, "zen_settings_button"); apply(self.exit_button, "zen_exit_button")
+        apply(self.pomodoro_title_label, "zen_pomodoro_title"); apply(self.pomodoro_label, "zen_pomodoro_label"); apply(self.word_count_label, "zen_word_count")
+        apply(self.pomodoro_start_button, "zen_pomodoro_button"); apply(self.pomodoro_reset_button, "zen_pomodoro_button")
     
     def update_background(self):
-        bg_path = self.settings.get("zen_bg_path"); self.background_pixmap = QPixmap(bg_path) if bg_path and os.path.exists(bg_path) else None; self.update()
+        bg_path = self.settings.get("zen_bg_path")
+        if not bg_path or not os.path.exists(bg_path): bg_path = None
+        if bg_path == self.background_path and self.background_pixmap is not None: self.update(); return # уже загружен
+        if bg_path != self.background_path: self.background_pixmap = None # до окончания загрузки рисуем фон темы
+        self.background_path = bg_path; self.scaled_background = None; self.request_background(); self.update()
+    def background_target_size(self): return self.size() * self.devicePixelRatioF()
+    def request_background(self):
+        if self.background_path: self.image_loader.request(self.background_path, self.background_target_size())
+    def on_background_loaded(self, path, image):
+        if path != self.background_path: return
+        self.background_pixmap = QPixmap.fromImage(image); self.scaled_background = None; self.update()
     
     def update_zen_settings(self, new_settings): 
+        changed = changed_settings(self.settings, new_settings)
+        if not changed: return
         self.settings = new_settings
         self.settings_updated_for_saving.emit(self.settings.copy())
-        self._update_styles()
-        self.update_background()
+        self._update_styles(changed)
+        if "zen_bg_path" in changed: self.update_background()
 
     def resizeEvent(self, event):
         self.audio_panel.move(20, self.height() - self.audio_panel.height() - 20); self.settings_button.move(self.width() - self.settings_button.width() - 20, self.height() - self.settings_button.height() - 20); self.exit_button.move(self.width() - self.exit_button.width() - 20, 20)
-        if self.settings_panel.isVisible(): self.settings_panel.move((self.width() - self.settings_panel.width()) // 2, (self.height() - self.settings_panel.height()) // 2)
+        if self.settings_panel and self.settings_panel.isVisible(): self.settings_panel.move((self.width() - self.settings_panel.width()) // 2, (self.height() - self.settings_panel.height()) // 2)
+        self.scaled_background = None
+        if self.background_path:
+            # Перечитываем файл, только если загруженная картинка меньше нового размера окна
+            target = self.background_target_size(); pm = self.background_pixmap
+            if pm is None or pm.width() < target.width() or pm.height() < target.height(): self.background_reload_timer.start()
         super().resizeEvent(event)
     def showEvent(self, event): self._update_styles(); super().showEvent(event)
     def deactivate_all_buttons(self):
@@ -824,16 +2685,23 @@ class ZenModeWindow(QWidget):
     def keyPressEvent(self, event: QKeyEvent):
         if event.key() == Qt.Key.Key_F11: self.close()
         elif event.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter) and (event.modifiers() & Qt.KeyboardModifier.ShiftModifier):
-            self.blockSignals(True); self.zen_saved_and_closed.emit(self.editor.toPlainText())
+            self.exit_emitted = True; self.zen_saved_and_closed.emit(self.editor.toPlainText())
         else: super().keyPressEvent(event)
     def closeEvent(self, event):
-        self.stop_all_music(); self.pomodoro_timer.stop(); self.pomodoro_running = False
-        if self.settings_panel.isVisible(): self.settings_panel.hide()
-        if not self.signalsBlocked(): self.zen_exited.emit(self.editor.toPlainText())
+        self.stop_all_music(); self.pomodoro_timer.stop(); self.pomodoro_running = False; self.background_reload_timer.stop(); self.autosave_idle_timer.stop(); self.autosave_max_timer.stop()
+        if self.settings_panel and self.settings_panel.isVisible(): self.settings_panel.hide()
+        if not self.exit_emitted: self.exit_emitted = True; self.zen_exited.emit(self.editor.toPlainText())
         event.accept()
     def paintEvent(self, event):
         painter = QPainter(self)
-        if self.background_pixmap: painter.drawPixmap(self.rect(), self.background_pixmap.scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation))
+        if self.background_pixmap:
+            dpr = self.devicePixelRatioF(); key = (self.background_path, self.size(), dpr)
+            if self.scaled_background is None or self.scaled_background_key != key:
+                # Масштабируем один раз на размер окна, а не на каждую перерисовку
+                self.scaled_background = self.background_pixmap.scaled(self.background_target_size(), Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation)
+                self.scaled_background.setDevicePixelRatio(dpr); self.scaled_background_key = key
+            pm = self.scaled_background
+            painter.drawPixmap(round((self.width() - pm.width() / dpr) / 2), round((self.height() - pm.height() / dpr) / 2), pm)
         else:
             theme_color_str = self.settings.get("dark_theme_bg") if self.settings.get("theme") == "dark" else self.settings.get("light_theme_bg")
             painter.fillRect(self.rect(), QColor(theme_color_str))
@@ -851,6 +2719,9 @@ class SettingsPanel(QWidget):
         main_layout.addWidget(self.tab_widget)
         
         self.color_widgets = {}
+        # Всплеск изменений сливается в одно применение; панель помнит, что уже отдала, и сообщает только разницу
+        self.applied_settings = self.settings.copy()
+        self.apply_timer = QTimer(self); self.apply_timer.setSingleShot(True); self.apply_timer.setInterval(SETTINGS_APPLY_INTERVAL_MS); self.apply_timer.timeout.connect(self.flush_changes)
 
         self.create_general_tab()
         self.create_appearance_tab()
@@ -866,6 +2737,7 @@ class SettingsPanel(QWidget):
         lang_layout = QHBoxLayout(); self.lang_label = QLabel(); lang_layout.addWidget(self.lang_label); self.lang_combo = QComboBox(); lang_layout.addWidget(self.lang_combo, 1); layout.addLayout(lang_layout)
         self.theme_group = QButtonGroup(self); theme_box = QHBoxLayout(); self.theme_label = QLabel(); self.main_dark_radio = QRadioButton(); self.main_light_radio = QRadioButton(); self.theme_group.addButton(self.main_dark_radio); self.theme_group.addButton(self.main_light_radio); theme_box.addWidget(self.theme_label); theme_box.addWidget(self.main_light_radio); theme_box.addWidget(self.main_dark_radio); theme_box.addStretch(); layout.addLayout(theme_box)
         self.pos_group = QButtonGroup(self); pos_box = QHBoxLayout(); self.pos_label = QLabel(); self.trigger_left_radio = QRadioButton(); self.trigger_right_radio = QRadioButton(); self.pos_group.addButton(self.trigger_left_radio); self.pos_group.addButton(self.trigger_right_radio); pos_box.addWidget(self.pos_label); pos_box.addWidget(self.trigger_left_radio); pos_box.addWidget(self.trigger_right_radio); pos_box.addStretch(); layout.addLayout(pos_box)
+        autosave_layout = QHBoxLayout(); self.notes_autosave_label = QLabel(); self.notes_autosave_spin = QSpinBox(); self.notes_autosave_spin.setRange(0, 600); autosave_layout.addWidget(self.notes_autosave_label); autosave_layout.addWidget(self.notes_autosave_spin); autosave_layout.addStretch(); layout.addLayout(autosave_layout)
         layout.addStretch()
         self.general_tab = tab
         self.tab_widget.addTab(tab, "")
@@ -937,6 +2809,7 @@ class SettingsPanel(QWidget):
         self.horiz_padding.setValue(self.settings.get("zen_padding_horiz", 15))
         self.vert_padding.setValue(self.settings.get("zen_padding_vert", 10))
         self.first_line_indent_spin.setValue(self.settings.get("zen_first_line_indent", 0))
+        self.notes_autosave_spin.setValue(self.settings.get("notes_autosave_seconds", 0))
 
         self.update_color_swatches()
 
@@ -964,6 +2837,7 @@ class SettingsPanel(QWidget):
         self.horiz_padding.valueChanged.connect(self.apply_changes)
         self.vert_padding.valueChanged.connect(self.apply_changes)
         self.first_line_indent_spin.valueChanged.connect(self.apply_changes)
+        self.notes_autosave_spin.valueChanged.connect(self.apply_changes)
     
     def retranslate_ui(self):
         self.title_label.setText(f"<b>{self.loc.get('settings_title')}</b>")
@@ -1000,6 +2874,7 @@ class SettingsPanel(QWidget):
         self.horiz_pad_label.setText(self.loc.get("settings_padding_horiz"))
         self.vert_pad_label.setText(self.loc.get("settings_padding_vert"))
         self.indent_label.setText(self.loc.get("settings_first_line_indent"))
+        self.notes_autosave_label.setText(self.loc.get("settings_notes_autosave_label", "Автосохранение заметок через (с, 0 - выкл.):"))
         
     def choose_color(self, setting_key):
         current_color = self.settings.get(setting_key, "#ffffff")
@@ -1012,10 +2887,10 @@ class SettingsPanel(QWidget):
 
     def update_color_swatches(self):
         for key, (_, swatch, _) in self.color_widgets.items():
-            swatch.setStyleSheet(f"background-color: {self.settings.get(key)}; border: 1px solid #888;")
+            ThemeEngine.set_style(swatch, f"background-color: {self.settings.get(key)}; border: 1px solid #888;")
         
         zen_color = self.settings.get("zen_font_color", "") or "#00000000" 
-        self.zen_font_color_swatch.setStyleSheet(f"background-color: {zen_color}; border: 1px solid #888;")
+        ThemeEngine.set_style(self.zen_font_color_swatch, f"background-color: {zen_color}; border: 1px solid #888;")
 
     def clear_font_color(self): self.settings["zen_font_color"] = ""; self.update_color_swatches(); self.apply_changes()
     def browse_for_image(self):
@@ -1023,73 +2898,7 @@ class SettingsPanel(QWidget):
         if file_path: self.bg_path_edit.setText(file_path); self.apply_changes()
     def clear_background(self): self.bg_path_edit.setText(""); self.apply_changes()
 
-    def apply_styles(self):
-        is_dark = self.settings.get("theme", "light") == "dark"
-        bg_color = self.settings.get("dark_theme_bg") if is_dark else self.settings.get("light_theme_bg")
-        text_color = self.settings.get("dark_theme_text") if is_dark else self.settings.get("light_theme_text")
-        
-        panel_bg = QColor(bg_color); panel_bg.setAlpha(245)
-        line_edit_bg = "rgba(0,0,0,0.3)" if is_dark else "rgba(255,255,255,0.7)"
-        button_bg = "rgba(80,80,80,1)" if is_dark else "#e1e1e1"
-        
-        panel_bg_rgba = f"rgba({panel_bg.red()}, {panel_bg.green()}, {panel_bg.blue()}, {panel_bg.alphaF()})"
-        self.setStyleSheet(f"""
-            QWidget#SettingsPanel {{ 
-                background-color: {panel_bg_rgba};
-                border-radius: 10px; color: {text_color};
-            }} 
-            QLabel, QCheckBox, QRadioButton {{ color: {text_color}; background: transparent;}} 
-
-            QCheckBox::indicator, QRadioButton::indicator {{
-                width: 14px;
-                height: 14px;
-                border: 1px solid #555;
-                background-color: {line_edit_bg};
-            }}
-            QCheckBox::indicator {{
-                border-radius: 3px;
-            }}
-            QRadioButton::indicator {{
-                border-radius: 7px; /* делаем круглой */
-            }}
-            QCheckBox::indicator:checked, QRadioButton::indicator:checked {{
-                background-color: {self.settings.get("accent_color")};
-                border-color: {QColor(self.settings.get("accent_color")).darker(115).name()};
-            }}
-            QRadioButton::indicator:checked {{
-                /* Добавляем внутренний кружок для радио-кнопки */
-                image: url(:/qt-project.org/styles/commonstyle/images/radiobutton-on-16.png);
-            }}
-          
-            QLineEdit, QSpinBox, QFontComboBox, QComboBox {{ 
-                background-color: {line_edit_bg}; border: 1px solid #555; 
-                color: {text_color}; padding: 4px; border-radius: 3px;
-            }} 
-            QComboBox QAbstractItemView {{
-                background-color: {line_edit_bg};
-                color: {text_color};
-                border: 1px solid #555;
-                selection-background-color: {self.settings.get("accent_color")};
-                outline: 0px; /* Убирает рамку выделения */
-            }}
-            QPushButton {{ 
-                background-color: {button_bg}; color: {text_color}; 
-                border: 1px solid #555; padding: 4px 8px; border-radius: 3px;
-            }} 
-            QPushButton:hover {{ background-color: #555; }}
-            QTabWidget::pane {{ border: 1px solid #444; }}
-            QTabBar::tab {{ 
-                background: {"rgba(255,255,255,0.1)" if is_dark else "rgba(0,0,0,0.05)"}; 
-                color: {text_color}; padding: 8px 12px;
-                border-top-left-radius: 4px; border-top-right-radius: 4px;
-            }}
-            QTabBar::tab:selected, QTabBar::tab:hover {{
-                background: {"rgba(255,255,255,0.2)" if is_dark else "rgba(0,0,0,0.1)"};
-            }}
-            QSpinBox::up-button {{ subcontrol-position: top right; width: 16px; }}
-            QSpinBox::down-button {{ subcontrol-position: bottom right; width: 16px; }}
-            QSpinBox::up-arrow, QSpinBox::down-arrow {{ width: 10px; height: 10px; }}
-        """)
+    def apply_styles(self): theme_engine.apply(self, "settings_panel", self.settings)
 
     def apply_changes(self):
         self.settings["language"] = self.lang_combo.currentData()
@@ -1103,11 +2912,18 @@ class SettingsPanel(QWidget):
         self.settings["zen_padding_horiz"] = self.horiz_padding.value()
         self.settings["zen_padding_vert"] = self.vert_padding.value()
         self.settings["zen_first_line_indent"] = self.first_line_indent_spin.value()
-        
-        if self.loc.current_lang != self.settings["language"]:
+        self.settings["notes_autosave_seconds"] = self.notes_autosave_spin.value()
+        # Таймер не перезапускается: при непрерывных изменениях применение идёт раз в интервал, а не после отпускания
+        if not self.apply_timer.isActive(): self.apply_timer.start()
+
+    def flush_changes(self):
+        self.apply_timer.stop()
+        changed = changed_settings(self.applied_settings, self.settings)
+        if not changed: return
+        self.applied_settings = self.settings.copy()
+        if "language" in changed and self.loc.current_lang != self.settings["language"]:
             self.loc.set_language(self.settings["language"])
-            
-        self.apply_styles()
+        if not changed.isdisjoint(THEME_SETTING_KEYS): self.apply_styles()
         self.settings_changed.emit(self.settings.copy())
 
 class MainPopup(QWidget):
@@ -1134,156 +2950,25 @@ class MainPopup(QWidget):
         self.animation_group = QParallelAnimationGroup(self); self.animation_group.addAnimation(self.pos_animation); self.animation_group.addAnimation(self.opacity_animation)
         self.animation_group.finished.connect(self.on_animation_finished)
         
-        self.set_status_saved(); self.notes_panel.zen_mode_requested.connect(data_manager.enter_zen_mode)
+        self._status_saved = None; self.set_status_saved(); self.notes_panel.zen_mode_requested.connect(data_manager.enter_zen_mode)
     
     def retranslate_ui(self):
         self.tasks_panel.retranslate_ui()
         self.notes_panel.retranslate_ui()
-        self.on_data_changed()
-        self.set_status_saved()
+        self._status_saved = None; self.data_manager.main_popup_on_data_changed()
         
     def apply_theme(self, settings):
-        is_dark = settings.get("theme", "light") == "dark"
-        accent_color = settings.get("accent_color", "#007bff")
-        bg_color = settings.get("dark_theme_bg") if is_dark else settings.get("light_theme_bg")
-        text_color = settings.get("dark_theme_text") if is_dark else settings.get("light_theme_text")
-        list_text_color = settings.get("dark_theme_list_text") if is_dark else settings.get("light_theme_list_text")
-        component_bg = QColor(bg_color).lighter(115).name() if is_dark else QColor(bg_color).darker(105).name()
-        border_color = "#555555" if is_dark else "#ced4da"
-        
-        stylesheet = f"""
-            QWidget#MainPopup {{ 
-                background-color: {bg_color}; 
-            }}
-            QWidget {{
-                color: {text_color};
-            }} 
-            QLabel {{ 
-                background-color: transparent; 
-            }} 
-            QLabel#titleLabel {{ 
-                font-size: 14px; font-weight: bold; 
-            }} 
-            QLineEdit, QTextEdit, QComboBox {{ 
-                background-color: {component_bg}; 
-                border: 1px solid {border_color}; 
-                border-radius: 4px; padding: 5px; 
-            }} 
-            QListWidget {{ 
-                background-color: {component_bg}; 
-                border: 1px solid {border_color}; 
-            }}
-            QListWidget:focus {{
-                outline: none;
-            }}
-
-            /* --- Стилизация элементов списка --- */
-            QListWidget::item {{
-                color: {list_text_color};
-                padding: 5px; 
-                border-radius: 4px;
-            }}
-            QListWidget::item:hover {{
-                background-color: rgba(128, 128, 128, 0.15);
-            }}
-
-            /* --- ОТКЛЮЧАЕМ ВЫДЕЛЕНИЕ В СПИСКЕ ЗАДАЧ --- */
-            QListWidget#TaskList::item:selected {{
-                background-color: transparent;
-                color: {list_text_color};
-            }}
-            
-            QListWidget::item:selected {{
-                background-color: {accent_color};
-                color: white;
-            }}
-            
-            /* --- Стилизация индикатора (галочки) в списке ЗАДАЧ --- */
-            QListWidget::indicator {{
-                width: 14px;
-                height: 14px;
-                border: 1px solid {border_color};
-                border-radius: 3px;
-                background-color: {component_bg};
-            }}
-            QListWidget::indicator:checked {{
-                background-color: {accent_color};
-                border-color: {QColor(accent_color).darker(115).name()};
-                /* image: url(:/qt-project.org/styles/commonstyle/images/standardbutton-apply-16.png); */
-            }}
-            
-            QListWidget::item:checked {{
-                color: gray;
-            }}
-            QListWidget#TaskList::item:selected:checked {{
-                color: gray;
-            }}
-            QListWidget::item:selected:checked {{
-                color: white;
-            }}
-            
-            QPushButton {{ 
-                background-color: {component_bg}; 
-                color: {text_color};
-                border: 1px solid {border_color}; 
-                padding: 5px 10px; border-radius: 4px; 
-            }} 
-            QCheckBox::indicator {{
-                width: 14px;
-                height: 14px;
-                border: 1px solid {border_color};
-                background-color: {component_bg};
-                border-radius: 3px;
-            }}
-            QCheckBox::indicator:checked {{
-                background-color: {accent_color};
-                border-color: {QColor(accent_color).darker(115).name()};
-            }}
-            QPushButton:hover {{ 
-                background-color: {QColor(component_bg).lighter(110).name()}; 
-            }} 
-            QPushButton#save_button {{ 
-                background-color: {accent_color}; color: white; border-color: {accent_color}; font-weight: bold; 
-            }} 
-            QPushButton#close_button {{ 
-                font-family: 'Arial'; font-size: 14px; font-weight: bold; 
-                background-color: transparent; color: #888; border: none; 
-            }} 
-            QPushButton#close_button:hover {{ 
-                background-color: #dc3545; color: white; border-radius: 12px; 
-            }} 
-            QSplitter::handle {{ 
-                background-color: {border_color}; height: 3px; 
-            }}
-            QMenu {{
-                background-color: {component_bg};
-                color: {text_color};
-                border: 1px solid {border_color};
-                border-radius: 4px;
-                padding: 5px;
-            }}
-            QMenu::item {{
-                padding: 5px 25px 5px 20px;
-                border-radius: 4px;
-            }}
-            QMenu::item:selected {{
-                background-color: {accent_color};
-                color: white;
-            }}
-            QMenu::separator {{
-                height: 1px;
-                background: {border_color};
-                margin-left: 10px;
-                margin-right: 10px;
-            }}
-        """
-        self.setStyleSheet(stylesheet)
+        theme_engine.apply(self, "main_popup", settings)
         # Принудительно обновить стили для всех задач
-        for i in range(self.tasks_panel.task_list_widget.count()):
-            self.tasks_panel.update_task_item_style(self.tasks_panel.task_list_widget.item(i))
+        self.tasks_panel.restyle_tasks()
         
-    def on_data_changed(self): self.status_label.setText(self.loc.get("unsaved_changes_status")); self.status_label.setStyleSheet("color: #dc3545; font-size: 10px; margin-right: 5px;")
-    def set_status_saved(self): self.status_label.setText(self.loc.get("data_saved_status")); self.status_label.setStyleSheet("color: #28a745; font-size: 10px; margin-right: 5px;")
+    def on_data_changed(self): self.set_status(False)
+    def set_status_saved(self): self.set_status(True)
+    def set_status(self, saved):
+        if saved == self._status_saved: return # не перестилизуем метку без смены состояния
+        self._status_saved = saved
+        if saved: self.status_label.setText(self.loc.get("data_saved_status")); self.status_label.setStyleSheet("color: #28a745; font-size: 10px; margin-right: 5px;")
+        else: self.status_label.setText(self.loc.get("unsaved_changes_status")); self.status_label.setStyleSheet("color: #dc3545; font-size: 10px; margin-right: 5px;")
 
     def show_animated(self, position, from_left=False):
         if self.isVisible(): return
@@ -1321,115 +3006,210 @@ class MainPopup(QWidget):
 
 
 class TriggerButton(QPushButton):
-    def __init__(self, loc_manager):
-        super().__init__(">"); self.setObjectName("trigger_button"); self.loc_manager = loc_manager; self.loc = loc_manager; self.settings = DEFAULT_SETTINGS.copy(); self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.Tool | Qt.WindowType.WindowStaysOnTopHint); self.setFocusPolicy(Qt.FocusPolicy.NoFocus); self.setFixedSize(20, 100)
-        self.main_popup = None; self.about_dialog = None; self.zen_window = None; self.zen_source_timestamp = None; self.pending_zen_data = None; self.is_entering_zen = False; self.note_to_select_after_load = None
+    def __init__(self, loc_manager, profiler=None):
+        super().__init__(">"); self.profiler = profiler or StartupProfiler(False); self.setObjectName("trigger_button"); self.loc_manager = loc_manager; self.loc = loc_manager; self.settings = DEFAULT_SETTINGS.copy(); self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.Tool | Qt.WindowType.WindowStaysOnTopHint); self.setFocusPolicy(Qt.FocusPolicy.NoFocus); self.setFixedSize(20, 100)
+        self.main_popup = None; self.popup_theme = None; self.about_dialog = None; self.zen_window = None; self.zen_source_key = None; self.pending_zen_data = None; self.is_entering_zen = False; self.note_to_select_after_load = None; self.export_worker = None; self.import_worker = None
+        self.writer = BackgroundWriter(self); self.writer.write_finished.connect(self.on_write_finished); self.writer.start()
+        self.backup_store = BackupStore(); self.note_history = NoteHistory(self.writer)
         
         self.loc.language_changed.connect(self._on_language_changed)
         self.load_settings()
-        self.loc.set_language(self.settings.get("language", "ru_RU"))
+        self.storage = create_storage(self.settings.get("storage_mode", "sqlite"), self.writer)
+        self.profiler.mark("Настройки и хранилище")
         
         self.update_position_and_style();
         self.backup_timer = QTimer(self); self.backup_timer.timeout.connect(self.create_backup); self.backup_timer.start(600000)
-        QApplication.instance().aboutToQuit.connect(self.save_app_data)
+        self.settings_save_timer = QTimer(self); self.settings_save_timer.setSingleShot(True); self.settings_save_timer.setInterval(SETTINGS_SAVE_DELAY_MS); self.settings_save_timer.timeout.connect(self.save_settings)
+        QApplication.instance().aboutToQuit.connect(self.on_about_to_quit)
+        QTimer.singleShot(0, self.finish_startup) # остальное - после того, как кнопка уже на экране
+
+    def finish_startup(self):
+        self.profiler.mark("Показ кнопки")
+        self.loc.set_language(self.settings.get("language", "ru_RU")); self.profiler.mark("Локализация")
+        try: self.storage.load()
+        except Exception as e: print(f"Ошибка загрузки данных: {e}")
+        self.profiler.mark("Загрузка данных")
+        self.start_search_index_build()
+        self.check_zen_recovery(); self.profiler.mark("Проверка восстановления Zen")
+        self.profiler.report()
+        QTimer.singleShot(2000, self.prewarm_zen_window)
+
+    def start_search_index_build(self):
+        # Индекс поиска строится в фоне сразу после загрузки, а не на первом нажатии клавиши в поиске
+        threading.Thread(target=self.storage.build_search_index, daemon=True).start()
+
+    def prewarm_zen_window(self):
+        # Zen-окно (плееры, панели, фон) собирается заранее в простое, вход в Zen - только setPlainText и показ
+        if self.zen_window is not None: return
+        started = time.perf_counter()
+        self.zen_window = ZenModeWindow("", self.get_settings(), self.loc)
+        self.zen_window.settings_updated_for_saving.connect(self.update_settings)
+        self.zen_window.zen_exited.connect(lambda text: self.handle_zen_exit(text, should_clear=False))
+        self.zen_window.zen_saved_and_closed.connect(lambda text: self.handle_zen_exit(text, should_clear=True))
+        self.zen_window.zen_autosave.connect(self.write_zen_recovery)
+        # Фон декодируется сразу под размер экрана, на котором окно откроется
+        self.zen_window.setGeometry(QApplication.primaryScreen().geometry()); self.zen_window.update_background()
+        self.profiler.timing("Окно Zen подготовлено", started)
+
+    def is_zen_active(self): return self.zen_window is not None and self.zen_window.isVisible()
+    
+    def on_about_to_quit(self):
+        self.save_app_data()
+        if self.settings_save_timer.isActive(): self.save_settings()
+        if self.is_zen_active(): self.save_zen_note(self.zen_source_key, self.zen_window.editor.toPlainText())
+        if self.zen_window: self.zen_window.image_loader.shutdown()
+        for worker in (self.export_worker, self.import_worker):
+            if worker is not None and worker.isRunning(): worker.cancel(); worker.wait()
+        self.writer.shutdown() # дожидаемся, пока все отложенные записи попадут на диск
+
+    def on_write_finished(self, key, ok):
+        if key == self.storage.key and ok: self.main_popup_on_data_changed()
     
     def _on_language_changed(self):
         if self.main_popup: self.main_popup.retranslate_ui()
-        if self.zen_window and self.zen_window.settings_panel:
+        if self.zen_window and self.zen_window.settings_panel is not None:
             self.zen_window.settings_panel.retranslate_ui()
         self.update_position_and_style()
 
     def update_position_and_style(self):
-        screen_geometry = QApplication.primaryScreen().geometry(); pos = self.settings.get("trigger_pos", "right"); accent_color = self.settings.get("accent_color", "#007bff")
-        style = f"background-color: {accent_color}; color: white; font-size: 14px; font-weight: bold;"
-        if pos == "left": self.move(0, int(screen_geometry.height() * 0.4)); self.setText("<"); style += "border-top-right-radius: 5px; border-bottom-right-radius: 5px; border-left: none;"
-        else: self.move(screen_geometry.width() - self.width(), int(screen_geometry.height() * 0.4)); self.setText(">"); style += "border-top-left-radius: 5px; border-bottom-left-radius: 5px; border-right: none;"
-        self.setStyleSheet(f"QPushButton#trigger_button {{ {style} }} QPushButton#trigger_button:hover {{ opacity: 0.8; }}")
+        screen_geometry = QApplication.primaryScreen().geometry(); pos = self.settings.get("trigger_pos", "right")
+        if pos == "left": self.move(0, int(screen_geometry.height() * 0.4)); self.setText("<")
+        else: self.move(screen_geometry.width() - self.width(), int(screen_geometry.height() * 0.4)); self.setText(">")
+        theme_engine.apply(self, "trigger_button", self.settings)
     
-    def show_main_popup(self, note_to_select=None):
+    def show_main_popup(self, note_to_select=None, clear_editor=False):
+        started = time.perf_counter(); is_cold = self.main_popup is None
+        reload_data = self.storage.changed_on_disk(); draft = None
+        if reload_data and self.main_popup is not None and self.main_popup.notes_panel.is_dirty:
+            draft = (self.main_popup.notes_panel.current_note_key, self.main_popup.notes_panel.notes_editor.toPlainText())
+        if reload_data:
+            print("Файл данных изменён на диске, перечитываем."); self.storage.load(force=True); self.start_search_index_build()
         if self.main_popup is None:
             self.note_to_select_after_load = note_to_select
             self.main_popup = MainPopup(self)
             self.main_popup.animation_finished_and_hidden.connect(self.on_popup_closed)
             self.load_app_data()
+            self.main_popup.retranslate_ui(); self.popup_theme = None
+        elif reload_data:
+            self.note_to_select_after_load = note_to_select; self.load_app_data()
+            if draft: self.main_popup.notes_panel.restore_draft(*draft) # перечитывание не должно молча терять черновик
+        elif note_to_select: self.main_popup.notes_panel.find_and_select_note(note_to_select)
+        elif clear_editor: self.main_popup.notes_panel.clear_for_new_note(force=True)
         
-        self.main_popup.retranslate_ui()
-        self.main_popup.apply_theme(self.settings); pos = self.settings.get("trigger_pos", "right"); 
+        # Тёплое окно: тема переприменяется только если настройки изменились с прошлого показа
+        if self.popup_theme != theme_settings(self.settings): self.main_popup.apply_theme(self.settings); self.popup_theme = theme_settings(self.settings)
+        pos = self.settings.get("trigger_pos", "right")
         
         screen_geo = QApplication.primaryScreen().availableGeometry()
         popup_x = self.width() if pos == "left" else screen_geo.width() - 380
         player_pos = QPoint(popup_x, screen_geo.y())
         
         self.main_popup.show_animated(player_pos, from_left=(pos == "left"))
+        if self.profiler.enabled: QTimer.singleShot(0, lambda: self.profiler.timing(f"Панель показана ({'создание' if is_cold else 'повторное открытие'})", started))
 
-    def enter_zen_mode(self, initial_text, timestamp):
-        self.pending_zen_data = (initial_text, timestamp); self.is_entering_zen = True
+    def enter_zen_mode(self, initial_text, note_key):
+        self.pending_zen_data = (initial_text, note_key); self.is_entering_zen = True
         if self.main_popup and self.main_popup.isVisible():
             self.main_popup.close()
         else:
             self.on_popup_closed()
 
     def handle_zen_exit(self, text_from_zen, should_clear):
-        if self.zen_window: self.zen_window.close(); self.zen_window = None
+        if self.zen_window: self.zen_window.close() # окно скрывается и остаётся для следующего входа
         self.show()
-        self.save_zen_note(self.zen_source_timestamp, text_from_zen)
-        note_to_select = None if should_clear else self.zen_source_timestamp
-        self.show_main_popup(note_to_select=note_to_select)
+        changed = self.save_zen_note(self.zen_source_key, text_from_zen)
+        if changed and self.main_popup and self.zen_source_key: self.main_popup.notes_panel.refresh_note(self.zen_source_key)
+        note_to_select = None if should_clear else self.zen_source_key
+        self.show_main_popup(note_to_select=note_to_select, clear_editor=should_clear)
 
     def on_popup_closed(self):
         if self.main_popup: self.save_app_data()
         
         if self.is_entering_zen:
             self.is_entering_zen = False
-            initial_text, timestamp = self.pending_zen_data; self.zen_source_timestamp = timestamp; self.pending_zen_data = None; self.hide()
-            self.zen_window = ZenModeWindow(initial_text, self.get_settings(), self.loc)
-            self.zen_window.settings_updated_for_saving.connect(self.update_settings)
-            self.zen_window.zen_exited.connect(lambda text: self.handle_zen_exit(text, should_clear=False))
-            self.zen_window.zen_saved_and_closed.connect(lambda text: self.handle_zen_exit(text, should_clear=True))
+            initial_text, note_key = self.pending_zen_data; self.zen_source_key = note_key or None; self.pending_zen_data = None; self.hide()
+            self.prewarm_zen_window()
+            self.zen_window.start_session(initial_text, self.get_settings())
             self.zen_window.showFullScreen()
         
-        if self.main_popup:
+        # На время Zen панель остаётся в памяти, чтобы после выхода не перечитывать весь архив
+        if self.main_popup and not self.settings.get("keep_popup_alive", True) and not self.is_zen_active():
             self.main_popup.deleteLater()
             self.main_popup = None
 
     def update_settings(self, new_settings):
+        changed = changed_settings(self.settings, new_settings)
+        if not changed: return
         self.settings = new_settings
-        self.save_settings()
-        self.update_position_and_style()
-        if self.main_popup and self.main_popup.isVisible():
-            self.main_popup.apply_theme(new_settings)
+        self.settings_save_timer.start() # серия изменений - одна запись на диск
+        if not changed.isdisjoint(("trigger_pos", "accent_color")): self.update_position_and_style()
+        if self.main_popup and self.main_popup.isVisible() and not changed.isdisjoint(THEME_SETTING_KEYS):
+            self.main_popup.apply_theme(new_settings); self.popup_theme = theme_settings(new_settings)
 
     def create_backup(self):
         self.save_app_data()
-        if os.path.exists(DATA_FILE):
-            try: shutil.copyfile(DATA_FILE, BACKUP_FILE); print(f"Резервная копия создана: {BACKUP_FILE}")
-            except Exception as e: print(f"Не удалось создать резервную копию: {e}")
+        # Снимок пишется из памяти: DATA_FILE без журнала может быть неполным
+        self.storage.write_backup(self.backup_store)
             
     def restore_from_backup(self):
-        if not os.path.exists(BACKUP_FILE): QMessageBox.warning(self, "Ошибка", "Файл резервной копии не найден."); return
-        reply = QMessageBox.question(self, "Восстановление", "Вы уверены, что хотите восстановить данные из резервной копии?\nВсе текущие несохраненные изменения будут потеряны.", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
+        # Хэш из имени файла различает поколения, созданные в одну и ту же секунду
+        choices = {f"{dt:%Y-%m-%d %H:%M:%S} ({digest})": path for dt, digest, path in self.backup_store.generations()}
+        if os.path.exists(BACKUP_FILE): choices[BACKUP_FILE] = BACKUP_FILE
+        if not choices: QMessageBox.warning(self, "Ошибка", "Резервные копии не найдены."); return
+        label, ok = QInputDialog.getItem(self, "Восстановление", "Выберите резервную копию для восстановления.\nВсе текущие несохраненные изменения будут потеряны.", list(choices), 0, False)
+        if ok and label:
             try:
-                shutil.copyfile(BACKUP_FILE, DATA_FILE);
+                data = self.backup_store.read(choices[label])
+                self.create_backup() # текущее состояние остаётся отдельным поколением
+                self.storage.replace(data); self.start_search_index_build()
                 if self.main_popup: self.load_app_data()
                 QMessageBox.information(self, "Успех", "Данные успешно восстановлены.")
             except Exception as e: QMessageBox.critical(self, "Ошибка", f"Не удалось восстановить данные: {e}")
             
     def export_notes_to_markdown(self):
-        self.save_app_data()
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f: data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError): QMessageBox.warning(self, "Ошибка", "Нет данных для экспорта."); return
-        notes = sorted(data.get("notes", []), key=lambda x: x.get('timestamp', ''))
-        if not notes: QMessageBox.information(self, "Информация", "Нет заметок для экспорта."); return
-        path, _ = QFileDialog.getSaveFileName(self, "Экспорт заметок", "Мои_заметки.md", "Markdown Files (*.md);;Text Files (*.txt)")
-        if path:
-            try:
-                with open(path, 'w', encoding='utf-8') as f:
-                    f.write("# Экспорт заметок\n\n");
-                    for note in notes: f.write(f"## Заметка от: {note.get('timestamp', '')}\n\n{note.get('text', '')}\n\n---\n\n")
-                QMessageBox.information(self, "Успех", f"Заметки успешно экспортированы в {path}")
-            except Exception as e: QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать файл: {e}")
+        if self.export_worker is not None and self.export_worker.isRunning(): return
+        if self.main_popup: self.main_popup.notes_panel.save_if_dirty()
+        if not self.storage.loaded: self.storage.load()
+        if not self.storage.notes: QMessageBox.information(self, "Информация", "Нет заметок для экспорта."); return
+        box = QMessageBox(self); box.setWindowTitle("Экспорт заметок"); box.setText("Как экспортировать заметки?")
+        single_button = box.addButton("Один файл", QMessageBox.ButtonRole.AcceptRole)
+        tree_button = box.addButton("Папка: файл на заметку, по тегам", QMessageBox.ButtonRole.AcceptRole)
+        box.addButton(QMessageBox.StandardButton.Cancel); box.exec()
+        if box.clickedButton() == single_button: path, _ = QFileDialog.getSaveFileName(self, "Экспорт заметок", "Мои_заметки.md", "Markdown Files (*.md);;Text Files (*.txt)")
+        elif box.clickedButton() == tree_button: path = QFileDialog.getExistingDirectory(self, "Папка для экспорта")
+        else: return
+        if not path: return
+        self.export_worker = MarkdownExporter(self.storage, path, per_note=box.clickedButton() == tree_button, parent=self)
+        progress = QProgressDialog("Экспорт заметок...", "Отмена", 0, len(self.storage.notes), self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal); progress.setMinimumDuration(300)
+        progress.canceled.connect(self.export_worker.cancel)
+        self.export_worker.progress.connect(lambda done, total: (progress.setMaximum(total), progress.setValue(done)))
+        self.export_worker.export_finished.connect(lambda ok, message: self.on_background_task_finished(progress, ok, message))
+        self.export_worker.start()
+
+    def import_notes_from_folder(self):
+        if self.import_worker is not None and self.import_worker.isRunning(): return
+        directory = QFileDialog.getExistingDirectory(self, "Папка с заметками (.md, .txt)")
+        if not directory: return
+        if not self.storage.loaded: self.storage.load()
+        self.import_worker = MarkdownImporter(self.storage, directory, parent=self)
+        progress = QProgressDialog("Импорт заметок...", "Отмена", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal); progress.setMinimumDuration(300)
+        progress.canceled.connect(self.import_worker.cancel)
+        self.import_worker.progress.connect(lambda done, total: (progress.setMaximum(total), progress.setValue(done)))
+        self.import_worker.batch_ready.connect(self.on_import_batch)
+        self.import_worker.import_finished.connect(lambda ok, message: self.on_background_task_finished(progress, ok, message, "Импорт заметок"))
+        self.import_worker.start()
+
+    def on_import_batch(self, notes):
+        self.storage.commit_many([{"op": "note_upsert", "note": note} for note in notes])
+        if self.main_popup: self.main_popup.notes_panel.add_notes(notes)
+        self.main_popup_on_data_changed()
+
+    def on_background_task_finished(self, progress, ok, message, title="Экспорт заметок"):
+        progress.reset()
+        if ok: QMessageBox.information(self, title, message)
+        else: QMessageBox.critical(self, "Ошибка", message)
     
     def show_about_dialog(self):
         if self.about_dialog is None:
@@ -1449,14 +3229,13 @@ class TriggerButton(QPushButton):
     
     def main_popup_on_data_changed(self):
         if hasattr(self, 'main_popup') and self.main_popup:
-            if self.main_popup.notes_panel.is_dirty: self.main_popup.on_data_changed()
+            # Зелёный статус только когда редактор чист и все изменения уже записаны потоком записи
+            if self.main_popup.notes_panel.is_dirty or self.storage.has_pending_writes(): self.main_popup.on_data_changed()
             else: self.main_popup.set_status_saved()
 
     def save_settings(self):
-        try:
-            with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, ensure_ascii=False, indent=4)
-        except Exception as e: print(f"Ошибка сохранения настроек: {e}")
+        self.settings_save_timer.stop()
+        self.writer.write_json(SETTINGS_FILE, dict(self.settings))
 
     def load_settings(self):
         try:
@@ -1466,108 +3245,87 @@ class TriggerButton(QPushButton):
         except (FileNotFoundError, json.JSONDecodeError):
             print("Файл настроек не найден, используются значения по умолчанию."); self.settings = DEFAULT_SETTINGS.copy()
 
-    def save_app_data(self):
+    def save_app_data(self, change=None):
         if not self.main_popup: return
-        data_to_save = {
-            "task_lists": self.main_popup.tasks_panel.get_task_lists_data(),
-            "active_task_list": self.main_popup.tasks_panel.current_list_name,
-            "notes": self.main_popup.notes_panel.get_notes_data(),
-            "splitter_state": self.main_popup.splitter.saveState().toHex().data().decode('ascii')
-        }
-        try:
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-            if self.main_popup.isVisible(): self.main_popup.set_status_saved()
+        if change is None:
+            meta = {
+                "active_task_list": self.main_popup.tasks_panel.current_list_name,
+                "splitter_state": self.main_popup.splitter.saveState().toHex().data().decode('ascii')
+            }
+            if meta == self.storage.meta: return
+            change = {"op": "meta", "meta": meta}
+        self.commit_change(change)
+        self.main_popup_on_data_changed()
+
+    def commit_change(self, change):
+        try: self.storage.commit(change)
         except Exception as e: print(f"Ошибка сохранения данных: {e}")
 
     def load_app_data(self):
         if not self.main_popup: return
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f: data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("Файл данных не найден."); data = {}
+        data = self.storage.load()
         
         self.main_popup.tasks_panel.load_task_lists(data.get("task_lists", {}), data.get("active_task_list", ""))
         self.main_popup.notes_panel.load_notes(data.get("notes", []))
         
         if self.note_to_select_after_load:
-            self.main_popup.notes_panel.find_and_select_note_by_timestamp(self.note_to_select_after_load)
+            self.main_popup.notes_panel.find_and_select_note(self.note_to_select_after_load)
             self.note_to_select_after_load = None
-        if self.main_popup.isVisible(): self.main_popup.set_status_saved()
+        self.main_popup_on_data_changed()
             
-    def save_zen_note(self, note_timestamp, new_text):
-        if not new_text.strip() and not note_timestamp: return
+    def save_zen_note(self, note_key, new_text):
+        if not new_text.strip() and not note_key: self.clear_zen_recovery(); return False
+        previous = self.storage.get_note(note_key) if note_key else None
+        try: self.zen_source_key, changed = self.storage.save_note_text(note_key, new_text)
+        except Exception as e: print(f"Ошибка сохранения данных: {e}"); return False
+        if changed: self.note_history.record(self.storage.get_note(self.zen_source_key), previous)
+        self.clear_zen_recovery() # текст сохранён в хранилище, снимок больше не нужен
+        return changed
+
+    def write_zen_recovery(self, text):
+        # Снимок пишется потоком записи; следующий снимок или удаление заменяют ещё не записанный
+        snapshot = {"note_id": self.zen_source_key or "", "saved_at": note_now(), "text": text}
+        self.writer.submit(ZEN_RECOVERY_FILE, lambda: write_json_atomic(ZEN_RECOVERY_FILE, snapshot, indent=None))
+
+    def clear_zen_recovery(self): self.writer.submit(ZEN_RECOVERY_FILE, lambda: remove_file(ZEN_RECOVERY_FILE))
+
+    def check_zen_recovery(self):
+        # Снимок остаётся на диске только если Zen-сессия не завершилась штатно
         try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f: data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError): data = {"notes": [], "task_lists": {}}
-        
-        notes = data.get("notes", []); note_found = False
-        if note_timestamp:
-            for note in notes:
-                if note.get("timestamp") == note_timestamp:
-                    note["text"] = new_text; note_found = True; break
-        if not note_found:
-            new_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            notes.append({"timestamp": new_timestamp, "text": new_text})
-            self.zen_source_timestamp = new_timestamp
-        
-        data["notes"] = notes
-        try:
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-        except Exception as e: print(f"Ошибка сохранения zen-заметки: {e}")
+            with open(ZEN_RECOVERY_FILE, 'r', encoding='utf-8') as f: snapshot = json.load(f)
+        except FileNotFoundError: return
+        except (json.JSONDecodeError, OSError) as e: print(f"Не удалось прочитать {ZEN_RECOVERY_FILE}: {e}"); return
+        note_key = snapshot.get("note_id") or None; text = snapshot.get("text", "")
+        self.storage.load(); note = self.storage.get_note(note_key) if note_key else None
+        if not text.strip() or (note is not None and note.get("text", "") == text): self.clear_zen_recovery(); return
+        reply = QMessageBox.question(self, "Восстановление", f"Найден несохранённый текст из режима Zen ({snapshot.get('saved_at', '')}).\nВосстановить его?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.save_zen_note(note_key, text)
+            if self.main_popup: self.main_popup.notes_panel.refresh_note(self.zen_source_key)
+        else: self.clear_zen_recovery()
 
     def mousePressEvent(self, event: QMouseEvent):
         if event.button() == Qt.MouseButton.LeftButton: self.toggle_popup()
         elif event.button() == Qt.MouseButton.RightButton:
             context_menu = QMenu(self)
             
-            # --- НАЧАЛО ИЗМЕНЕНИЙ ---
-            # Получаем текущие настройки темы, чтобы меню соответствовало
-            settings = self.get_settings()
-            is_dark = settings.get("theme", "light") == "dark"
-            accent_color = settings.get("accent_color", "#007bff")
-            bg_color = settings.get("dark_theme_bg") if is_dark else settings.get("light_theme_bg")
-            text_color = settings.get("dark_theme_text") if is_dark else settings.get("light_theme_text")
-            border_color = "#555555" if is_dark else "#ced4da"
-            component_bg = QColor(bg_color).lighter(115).name() if is_dark else QColor(bg_color).darker(105).name()
-
-            menu_style = f"""
-                QMenu {{
-                    background-color: {component_bg};
-                    color: {text_color};
-                    border: 1px solid {border_color};
-                    border-radius: 4px;
-                    padding: 5px;
-                }}
-                QMenu::item {{
-                    padding: 5px 25px 5px 20px;
-                    border-radius: 4px;
-                }}
-                QMenu::item:selected {{
-                    background-color: {accent_color};
-                    color: white;
-                }}
-                QMenu::separator {{
-                    height: 1px;
-                    background: {border_color};
-                    margin-left: 10px;
-                    margin-right: 10px;
-                }}
-            """
-            context_menu.setStyleSheet(menu_style)
-            # --- КОНЕЦ ИЗМЕНЕНИЙ ---
+            # Меню в цветах текущей темы; таблица стилей берётся из кэша ThemeEngine
+            context_menu.setStyleSheet(theme_engine.render("menu", self.get_settings()))
 
             about_action = QAction(self.loc.get("about_menu"), self); about_action.triggered.connect(self.show_about_dialog); context_menu.addAction(about_action)
             export_action = QAction(self.loc.get("export_menu"), self); export_action.triggered.connect(self.export_notes_to_markdown)
+            import_action = QAction(self.loc.get("import_menu"), self); import_action.triggered.connect(self.import_notes_from_folder)
             restore_action = QAction(self.loc.get("restore_menu"), self); restore_action.triggered.connect(self.restore_from_backup)
             exit_action = QAction(self.loc.get("exit_menu"), self); exit_action.triggered.connect(QApplication.instance().quit)
-            context_menu.addSeparator(); context_menu.addAction(export_action); context_menu.addAction(restore_action); context_menu.addSeparator(); context_menu.addAction(exit_action)
+            context_menu.addSeparator(); context_menu.addAction(export_action); context_menu.addAction(import_action); context_menu.addAction(restore_action); context_menu.addSeparator(); context_menu.addAction(exit_action)
             context_menu.exec(event.globalPosition().toPoint())
 
 if __name__ == "__main__":
+    profiler = StartupProfiler("--profile-startup" in sys.argv)
+    profiler.mark("Импорт модулей")
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
+    profiler.mark("QApplication")
     
     #if os.path.exists(SETTINGS_FILE):
     #    try: os.remove(SETTINGS_FILE); print("Старый файл настроек удален.")
@@ -1577,7 +3335,7 @@ if __name__ == "__main__":
     #    except OSError as e: print(f"Ошибка удаления {DATA_FILE}: {e}")
 
     loc_manager = LocalizationManager()
-    trigger = TriggerButton(loc_manager)
+    trigger = TriggerButton(loc_manager, profiler)
     trigger.show()
     
     sys.exit(app.exec())
\ No newline at end of file
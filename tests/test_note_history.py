@@ -0,0 +1,71 @@
+import os
+import sys
+import random
+
+import pytest
+
+pytest.importorskip("PyQt6")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+class ImmediateWriter:
+    def submit(self, key, job): job()
+
+
+def chunk_count(history):
+    return history._reader().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+def test_chunk_text_splits_long_line():
+    text = "слово " * 5000
+    chunks = main.chunk_text(text)
+    assert "".join(chunks) == text and len(chunks) > 1 and max(map(len, chunks)) <= 4096
+
+
+def test_one_word_edit_of_single_line_note_stores_one_chunk(tmp_path):
+    random.seed(0)
+    words = ["".join(random.choice("абвгдежзabcdefg") for _ in range(random.randint(2, 9))) for _ in range(20000)]
+    history = main.NoteHistory(ImmediateWriter(), str(tmp_path / "history.db"))
+    history.record({"id": "1", "created": "2024-01-01", "text": " ".join(words)})
+    before = chunk_count(history)
+    words[len(words) // 2] = "правка"
+    history.record({"id": "1", "created": "2024-01-01", "text": " ".join(words)})
+    assert chunk_count(history) - before <= 2
+    assert history.text(history.revisions("1")[0][0]) == " ".join(words)
+
+
+class QueuedWriter:
+    def __init__(self): self.jobs = {}
+    def submit(self, key, job): self.jobs[key] = job
+    def run(self):
+        for job in self.jobs.values(): job()
+
+
+def test_quick_saves_keep_every_version(tmp_path):
+    writer = QueuedWriter(); history = main.NoteHistory(writer, str(tmp_path / "history.db"))
+    note = {"id": "1", "created": "2024-01-01", "text": "a"}
+    for text in ("b", "c"):
+        previous, note = note, dict(note, text=text)
+        history.record(note, previous)
+    writer.run()
+    assert [history.text(r[0]) for r in history.revisions("1")] == ["c", "b", "a"]
+
+
+def database_size(history, path):
+    history._reader().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path)
+
+
+def test_small_edits_grow_database_by_a_fraction_of_the_note(tmp_path):
+    random.seed(1)
+    words = ["".join(random.choice("абвгдежзabcdefg") for _ in range(random.randint(2, 9))) for _ in range(20000)]
+    path = str(tmp_path / "history.db"); history = main.NoteHistory(ImmediateWriter(), path)
+    history.record({"id": "1", "created": "2024-01-01", "text": " ".join(words)})
+    before = database_size(history, path); edits = 20
+    for i in range(edits):
+        words[i * 900] = "правка"
+        history.record({"id": "1", "created": "2024-01-01", "text": " ".join(words)})
+    history._write_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    # на версию - несколько новых блоков и 4 байта на ссылку, а не 65 байт hex-хэша на каждый блок
+    assert (database_size(history, path) - before) / edits < len(" ".join(words)) * 0.03
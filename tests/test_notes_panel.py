@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt6")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyQt6.QtWidgets import QApplication
+import main
+
+
+class FakeLoc:
+    def get(self, key, default=None): return default if default is not None else key
+
+
+class FakeHistory:
+    def record(self, note, previous=None): pass
+
+
+class FakeStorage:
+    def __init__(self, notes):
+        self.notes = {note["id"]: note for note in notes}; self.index = main.NoteSearchIndex()
+        for note in notes: self.index.update(note["id"], f"{note['created']} {note['text']}")
+    def get_note(self, key): return self.notes.get(key)
+    def get_search_index(self): return self.index
+
+
+class FakeDataManager:
+    def __init__(self, notes):
+        self.loc_manager = FakeLoc(); self.storage = FakeStorage(notes); self.note_history = FakeHistory()
+    def save_app_data(self, record):
+        if record["op"] == "note_upsert": self.storage.notes[record["note"]["id"]] = record["note"]
+    def main_popup_on_data_changed(self): pass
+    def get_settings(self): return {}
+
+
+@pytest.fixture
+def panel():
+    app = QApplication.instance() or QApplication([])
+    notes = [{"id": key, "created": f"2024-01-0{i + 1} 10:00", "text": text}
+             for i, (key, text) in enumerate([("a", "alpha one"), ("b", "beta two"), ("c", "gamma three")])]
+    panel = main.NotesPanel(FakeDataManager(notes)); panel.retranslate_ui(); panel.load_notes(notes)
+    yield panel
+    panel.deleteLater(); app.processEvents()
+
+
+def test_filter_keeps_open_note_in_editor(panel):
+    panel.find_and_select_note("b")
+    assert panel.notes_editor.toPlainText() == "beta two"
+    panel.search_input.setText("gamma")
+    assert panel.current_note_key == "b" and panel.notes_editor.toPlainText() == "beta two"
+    panel.search_input.setText("")
+    assert panel.current_note_key == "b" and panel.notes_editor.toPlainText() == "beta two"
+    assert panel.note_list_view.currentIndex().data(main.NotesListModel.KeyRole) == "b"
+
+
+def test_filter_keeps_unsaved_edit_of_hidden_note(panel):
+    panel.find_and_select_note("b"); panel.notes_editor.setPlainText("beta edited"); panel.notes_editor.document().setModified(True)
+    panel.search_input.setText("gamma"); panel.search_input.setText("")
+    assert panel.current_note_key == "b" and panel.notes_editor.toPlainText() == "beta edited"
+
+
+def test_search_shows_only_matches_and_clearing_restores_paging():
+    app = QApplication.instance() or QApplication([])
+    notes = [{"id": f"n{i:04}", "created": f"2024-01-01 {i:04}", "text": "needle" if i % 500 == 0 else "hay"} for i in range(1000)]
+    panel = main.NotesPanel(FakeDataManager(notes)); panel.retranslate_ui(); panel.load_notes(notes)
+    model = panel.notes_model
+    assert model.rowCount() == model.PAGE_SIZE
+    panel.search_input.setText("needle")
+    assert [model.key_at(row) for row in range(model.rowCount())] == ["n0500", "n0000"]
+    panel.search_input.setText("")
+    assert model.rowCount() == model.PAGE_SIZE and len(model.keys) == 1000
+    panel.deleteLater(); app.processEvents()
+
+
+def test_restore_draft_keeps_unsaved_text_after_reload(panel):
+    panel.find_and_select_note("b"); panel.notes_editor.setPlainText("beta draft"); panel.notes_editor.document().setModified(True)
+    draft = (panel.current_note_key, panel.notes_editor.toPlainText())
+    panel.load_notes(list(panel.data_manager.storage.notes.values())); panel.restore_draft(*draft)
+    assert panel.current_note_key == "b" and panel.notes_editor.toPlainText() == "beta draft" and panel.is_dirty